@@ -1,116 +1,953 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
+import time
+# 启动计时起点（--startup-time）
+STARTUP_T0 = time.perf_counter()
 import json
 import os
+import base64
+import sys
+import signal
 import threading
-import configparser
-import requests
-from bs4 import BeautifulSoup
+import queue
 import re
-import time
 import random
 import datetime
-import base64
 import hashlib
+import operator
+import mimetypes
+import shutil
 import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 
 # 简化版本 - 小红书笔记提取并上传飞书多维表格工具
 # 专为Windows环境优化，减少依赖项
 
+# tkinter 只在启动图形界面时导入，命令行模式可以在没有显示器的服务器上运行
+tk = ttk = filedialog = messagebox = scrolledtext = None
+
+def load_tkinter():
+    """导入tkinter到模块全局"""
+    global tk, ttk, filedialog, messagebox, scrolledtext
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, scrolledtext
+
+# requests/urllib3 在第一次创建HTTP会话时才导入，窗口先显示出来
+NETWORK_MODULES = ("requests", "urllib3")
+
+def preload_network_stack():
+    """后台预先导入网络库，首次提取时不用再等待"""
+    import requests.adapters  # noqa: F401
+    import urllib3.util.retry  # noqa: F401
+
+# 本地缓存目录（上传缓存等跨运行保存的数据）
+CACHE_DIR = os.path.join("data", "cache")
+
+def file_sha256(path):
+    """计算文件内容的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def write_json_atomic(path, data):
+    """先写临时文件再替换，避免中断时留下损坏的JSON文件"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# 日志
+LOG_LEVELS = {"INFO": 20, "WARNING": 30, "ERROR": 40}
+
 class SimpleLogger:
-    def __init__(self, text_widget=None):
+    def __init__(self, text_widget=None, stream=None, log_file=None, json_format=False, max_lines=5000):
         self.text_widget = text_widget
+        # 命令行模式输出到stderr，stdout留给机器可读的进度
+        self.stream = stream
+        self.json_format = json_format
+        # 文本框最多保留的行数，超出后删除最早的行
+        self.max_lines = max_lines
+        # 工作线程只把日志放入队列，由界面线程定时批量写入文本框（tkinter不是线程安全的）
+        self.queue = queue.SimpleQueue()
+        self.root = None
+        self.file_logger = None
+        self.file_listener = None
+        if log_file:
+            self.set_log_file(log_file)
+    
+    def set_log_file(self, path, max_bytes=10 * 1024 * 1024, backup_count=3):
+        """日志同时写入按大小轮转的文件，文件写入在后台线程中进行；path为空时关闭文件日志"""
+        import logging
+        import logging.handlers
         
-    def info(self, message):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"{timestamp} - INFO - {message}"
-        print(log_message)
+        self.close()
+        if not path:
+            return
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        log_queue = queue.SimpleQueue()
+        self.file_listener = logging.handlers.QueueListener(log_queue, file_handler)
+        self.file_listener.start()
+        
+        self.file_logger = logging.getLogger(f"simple_gui.{id(self)}")
+        self.file_logger.propagate = False
+        self.file_logger.setLevel(logging.INFO)
+        self.file_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    
+    def format(self, level, message, created, json_format=False):
+        """纯文本格式或每行一个JSON对象"""
+        timestamp = datetime.datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S")
+        if json_format:
+            return json.dumps({"time": timestamp, "level": level, "message": message}, ensure_ascii=False)
+        return f"{timestamp} - {level} - {message}"
+    
+    def log(self, level, message):
+        created = time.time()
+        log_message = self.format(level, message, created, self.json_format)
+        # 一次写入整行，多个线程同时输出时不会交错；无控制台的exe中 sys.stdout 为None，不输出
+        stream = self.stream or sys.stdout
+        if stream is not None:
+            stream.write(log_message + "\n")
+        if self.file_logger:
+            self.file_logger.log(LOG_LEVELS[level], log_message)
         if self.text_widget:
-            self.text_widget.configure(state='normal')
-            self.text_widget.insert(tk.END, log_message + '\n')
-            self.text_widget.configure(state='disabled')
-            self.text_widget.yview(tk.END)
+            # 文本框始终显示纯文本格式
+            self.queue.put(self.format(level, message, created) if self.json_format else log_message)
+    
+    def info(self, message):
+        self.log("INFO", message)
+    
+    def warning(self, message):
+        self.log("WARNING", message)
     
     def error(self, message):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"{timestamp} - ERROR - {message}"
-        print(log_message)
-        if self.text_widget:
-            self.text_widget.configure(state='normal')
-            self.text_widget.insert(tk.END, log_message + '\n')
-            self.text_widget.configure(state='disabled')
-            self.text_widget.yview(tk.END)
-
-# 小红书笔记模型
-class Note:
-    def __init__(self):
-        self.note_id = ""
-        self.title = ""
-        self.desc = ""
-        self.user_id = ""
-        self.nickname = ""
-        self.avatar = ""
-        self.ip_location = ""
-        self.liked_count = 0
-        self.collected_count = 0
-        self.comment_count = 0
-        self.share_count = 0
-        self.note_type = "normal"
-        self.image_list = []
-        self.tag_list = []
-        self.upload_time = ""
+        self.log("ERROR", message)
+    
+    def start_drain(self, root, interval=100, batch_size=1000):
+        """在界面线程中每 interval 毫秒把队列中的日志批量写入文本框"""
+        self.root = root
+        self.drain_interval = interval
+        self.drain_batch_size = batch_size
+        self.root.after(interval, self.drain)
+    
+    def drain(self):
+        lines = []
+        while len(lines) < self.drain_batch_size:
+            try:
+                lines.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
         
+        if lines:
+            widget = self.text_widget
+            widget.configure(state='normal')
+            widget.insert("end", "\n".join(lines) + "\n")
+            # 文本末尾总有一个空行，行数为 end-1c 的行号
+            excess = int(widget.index("end-1c").split(".")[0]) - 1 - self.max_lines
+            if excess > 0:
+                widget.delete("1.0", f"{excess + 1}.0")
+            widget.configure(state='disabled')
+            widget.yview("end")
+        
+        # 队列里还有积压时尽快继续
+        self.root.after(1 if len(lines) == self.drain_batch_size else self.drain_interval, self.drain)
+    
+    def close(self):
+        """停止文件日志的后台线程，把剩余日志写入文件"""
+        if self.file_listener:
+            self.file_listener.stop()
+            for handler in self.file_listener.handlers:
+                handler.close()
+            self.file_listener = None
+            self.file_logger = None
+
+# 数据模型
+def parse_count(value):
+    """把 1234、"1234"、"1.2万"、"10+" 等计数转换为整数，无法识别时为0"""
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return int(value)
+    if not isinstance(value, str):
+        return 0
+    
+    text = value.strip().rstrip("+")
+    multiplier = 1
+    if text.endswith("万") or text.lower().endswith("w"):
+        multiplier, text = 10000, text[:-1]
+    elif text.endswith("亿"):
+        multiplier, text = 100000000, text[:-1]
+    try:
+        return int(float(text) * multiplier)
+    except ValueError:
+        return 0
+
+def coerce_field(kind, value):
+    """按字段类型转换值，kind 为None时保持原样"""
+    if kind is int:
+        return parse_count(value)
+    if kind is str:
+        return "" if value is None else str(value)
+    if kind is list:
+        return list(value) if value else []
+    return value
+
+def parse_epoch_ms(value):
+    """把毫秒时间戳（或秒时间戳、时间字符串）转换为毫秒时间戳，无法识别时返回None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = int(value)
+    else:
+        text = str(value or "").strip()
+        if not text:
+            return None
+        if not text.isdigit():
+            for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+                try:
+                    return int(datetime.datetime.strptime(text, fmt).timestamp() * 1000)
+                except ValueError:
+                    continue
+            return None
+        number = int(text)
+    # 10位的是秒时间戳
+    return number * 1000 if 0 < number < 10 ** 11 else number
+
+class SimpleRecord:
+    """带 __slots__ 的记录基类，子类用 FIELDS 声明 (字段名, 类型, 默认值)"""
+    __slots__ = ()
+    FIELDS = ()
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_NAMES = tuple(name for name, _, _ in cls.FIELDS)
+        cls.FIELD_TYPES = {name: kind for name, kind, _ in cls.FIELDS}
+        # 一次取出所有字段值，序列化时不用逐个 getattr
+        cls.get_values = operator.attrgetter(*cls.FIELD_NAMES)
+    
+    def __init__(self, **values):
+        for name, kind, default in self.FIELDS:
+            setattr(self, name, [] if kind is list else default)
+        for name, value in values.items():
+            setattr(self, name, value)
+    
     def to_dict(self):
-        return {
-            "note_id": self.note_id,
-            "title": self.title,
-            "desc": self.desc,
-            "user_id": self.user_id,
-            "nickname": self.nickname,
-            "avatar": self.avatar,
-            "ip_location": self.ip_location,
-            "liked_count": self.liked_count,
-            "collected_count": self.collected_count,
-            "comment_count": self.comment_count,
-            "share_count": self.share_count,
-            "note_type": self.note_type,
-            "image_list": self.image_list,
-            "tag_list": self.tag_list,
-            "upload_time": self.upload_time
-        }
+        return dict(zip(self.FIELD_NAMES, self.get_values(self)))
+    
+    def to_row(self):
+        """按 FIELD_NAMES 顺序的一行值，用于列式导出"""
+        return self.get_values(self)
+    
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+    
+    @classmethod
+    def from_dict(cls, data):
+        record = cls()
+        types = cls.FIELD_TYPES
+        for key, value in data.items():
+            if key in types:
+                setattr(record, key, coerce_field(types[key], value))
+        return record
+    
+    def __repr__(self):
+        return f"{type(self).__name__}({self.FIELD_NAMES[0]}={self.get_values(self)[0]!r})"
+
+# 小红书笔记模型
+class Note(SimpleRecord):
+    FIELDS = (
+        ("note_id", str, ""),
+        ("title", str, ""),
+        ("desc", str, ""),
+        ("user_id", str, ""),
+        ("nickname", str, ""),
+        ("avatar", str, ""),
+        ("ip_location", str, ""),
+        ("liked_count", int, 0),
+        ("collected_count", int, 0),
+        ("comment_count", int, 0),
+        ("share_count", int, 0),
+        ("note_type", str, "normal"),
+        ("image_list", list, None),
+        ("tag_list", list, None),
+        # 毫秒时间戳或时间字符串，保持页面返回的原样
+        ("upload_time", None, "")
+    )
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+    
+    # 字段名 -> noteData 中的键
+    PAYLOAD_KEYS = (
+        ("title", "title"),
+        ("desc", "desc"),
+        ("user_id", "userId"),
+        ("nickname", "nickname"),
+        ("avatar", "avatar"),
+        ("ip_location", "ipLocation"),
+        ("liked_count", "likedCount"),
+        ("collected_count", "collectedCount"),
+        ("comment_count", "commentCount"),
+        ("share_count", "shareCount"),
+        ("upload_time", "time")
+    )
+    
+    @classmethod
+    def from_payload(cls, note_id, note_data):
+        """由页面中的 noteData 创建笔记"""
+        note = cls(note_id=note_id)
+        types = cls.FIELD_TYPES
+        for name, key in cls.PAYLOAD_KEYS:
+            value = note_data.get(key)
+            if value is not None:
+                setattr(note, name, coerce_field(types[name], value))
+        note.image_list = [img["url"] for img in note_data.get("imageList") or () if "url" in img]
+        note.tag_list = [tag["name"] for tag in note_data.get("tagList") or () if "name" in tag]
+        return note
 
 # 用户模型
-class User:
-    def __init__(self):
-        self.user_id = ""
-        self.nickname = ""
-        self.avatar = ""
-        self.desc = ""
-        self.gender = 0
-        self.follows = 0
-        self.fans = 0
-        self.notes_count = 0
-        self.location = ""
+class User(SimpleRecord):
+    FIELDS = (
+        ("user_id", str, ""),
+        ("nickname", str, ""),
+        ("avatar", str, ""),
+        ("desc", str, ""),
+        ("gender", int, 0),
+        ("follows", int, 0),
+        ("fans", int, 0),
+        ("notes_count", int, 0),
+        ("location", str, "")
+    )
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+    
+    # 字段名 -> userPageData 中的键
+    PAYLOAD_KEYS = (
+        ("nickname", "nickname"),
+        ("avatar", "images"),
+        ("desc", "desc"),
+        ("gender", "gender"),
+        ("follows", "follows"),
+        ("fans", "fans"),
+        ("notes_count", "notes"),
+        ("location", "location")
+    )
+    
+    @classmethod
+    def from_payload(cls, user_id, user_data):
+        """由页面中的 userPageData 创建用户"""
+        user = cls(user_id=user_id)
+        types = cls.FIELD_TYPES
+        for name, key in cls.PAYLOAD_KEYS:
+            value = user_data.get(key)
+            if value is not None:
+                setattr(user, name, coerce_field(types[name], value))
+        return user
+
+# 页面初始状态解析
+INITIAL_STATE_MARKER = b"window.__INITIAL_STATE__"
+# 只匹配处于取值位置的undefined（冒号、逗号、左方括号之后，逗号或右括号之前），
+# 用纯正则替换，避免逐个字符串回调的开销
+# 依次匹配字符串字面量（含转义）和裸的 undefined，字符串内容原样保留
+UNDEFINED_SCANNER = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|(?<![\w$])undefined(?![\w$])', re.S)
+JSON_DECODER = json.JSONDecoder()
+
+def replace_undefined(text):
+    """把字符串之外的 undefined 替换为 null，字符串中的 undefined 不受影响"""
+    return UNDEFINED_SCANNER.sub(lambda m: "null" if m.group(0) == "undefined" else m.group(0), text)
+
+def extract_initial_state(content):
+    """提取页面中 window.__INITIAL_STATE__ 的JSON数据，未找到时返回None
+
+    直接在响应字节中定位标记，用JSON解码器读到对象结束为止，不构建DOM树，
+    也不依赖分号切分（内容中含分号时同样可以解析）。
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    
+    start = content.find(INITIAL_STATE_MARKER)
+    if start < 0:
+        return None
+    start = content.find(b"{", start + len(INITIAL_STATE_MARKER))
+    if start < 0:
+        return None
+    
+    # 只解码所在脚本的片段
+    end = content.find(b"</script>", start)
+    if end < 0:
+        end = len(content)
+    text = content[start:end].decode("utf-8", errors="replace")
+    
+    if "undefined" in text:
+        text = replace_undefined(text)
+    
+    # raw_decode 在对象结束处停止，忽略后面的脚本内容
+    data, _ = JSON_DECODER.raw_decode(text)
+    return data
+
+# HTTP会话
+def get_accept_encoding():
+    """返回可声明的压缩编码，只有安装了brotli解码器时才声明br"""
+    try:
+        import brotli  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        pass
+    try:
+        import brotlicffi  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        return "gzip, deflate"
+
+def create_session(pool_sizes=None, default_pool_size=10, retries=3):
+    """创建带连接池、长连接和重试的HTTP会话
+
+    pool_sizes 为 {URL前缀: 连接池大小}，为常用主机单独设置连接池；
+    其余主机共用默认连接池。只对GET请求按状态码重试，POST只重试连接错误。
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    session = requests.Session()
+    session.headers.update({
+        "Accept-Encoding": get_accept_encoding(),
+        "Connection": "keep-alive"
+    })
+    
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False
+    )
+    
+    # 默认连接池，缓存多个主机（如图片CDN的多个域名）
+    default_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=default_pool_size, max_retries=retry)
+    session.mount("https://", default_adapter)
+    session.mount("http://", default_adapter)
+    
+    # 常用主机单独的连接池，前缀越长优先级越高
+    for prefix, pool_size in (pool_sizes or {}).items():
+        session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+    
+    return session
+
+# 令牌桶
+class SimpleTokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(self.rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, amount=1):
+        """取出amount个令牌，不足时等待（多线程共享）
+
+        允许令牌暂时透支，调用方按透支量睡眠，因此单次取用量可以超过桶容量。
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            deficit = -self.tokens
         
-    def to_dict(self):
-        return {
-            "user_id": self.user_id,
-            "nickname": self.nickname,
-            "avatar": self.avatar,
-            "desc": self.desc,
-            "gender": self.gender,
-            "follows": self.follows,
-            "fans": self.fans,
-            "notes_count": self.notes_count,
-            "location": self.location
-        }
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+    
+    def set_rate(self, rate):
+        """调整令牌生成速率"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = float(rate)
+
+# 小红书限流/验证码响应
+THROTTLE_STATUS_CODES = (429, 461, 471)
+
+def is_throttled_response(response):
+    """判断响应是否为限流或验证码页面"""
+    if response.status_code in THROTTLE_STATUS_CODES:
+        return True
+    # 风控时会返回 verifytype/verifyuuid 响应头，或跳转到验证码页面
+    if response.headers.get("verifytype") or response.headers.get("verifyuuid"):
+        return True
+    return "captcha" in response.url
+
+# 自适应限速
+class SimpleAdaptiveRateLimiter:
+    # 各类请求的 (初始速率, 最低速率, 最高速率)，单位：次/秒
+    DEFAULT_RATES = {
+        "note": (1.0, 0.1, 3.0),
+        "user": (1.0, 0.1, 3.0),
+        "search": (0.5, 0.05, 1.0),
+        "image": (5.0, 0.5, 20.0)
+    }
+    
+    def __init__(self, rates=None, increase_step=0.05, decrease_factor=0.5, backoff_base=2.0, backoff_max=120.0, logger=None):
+        self.rates = dict(self.DEFAULT_RATES)
+        if rates:
+            self.rates.update(rates)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.logger = logger or SimpleLogger()
+        self.buckets = {}
+        self.current_rates = {}
+        self.failures = {}
+        self.backoff_until = {}
+        self.lock = threading.Lock()
+    
+    def get_bucket(self, endpoint):
+        """每类请求一个令牌桶，容量为1，即不允许突发"""
+        with self.lock:
+            bucket = self.buckets.get(endpoint)
+            if bucket is None:
+                rate = self.rates.get(endpoint, self.rates["note"])[0]
+                bucket = SimpleTokenBucket(rate, capacity=1)
+                self.buckets[endpoint] = bucket
+                self.current_rates[endpoint] = rate
+            return bucket
+    
+    def acquire(self, endpoint):
+        """发送请求前调用：等待退避结束并取得令牌（多线程共享）"""
+        bucket = self.get_bucket(endpoint)
+        while True:
+            with self.lock:
+                delay = self.backoff_until.get(endpoint, 0) - time.monotonic()
+            if delay <= 0:
+                break
+            time.sleep(delay)
+        bucket.acquire()
+    
+    def on_success(self, endpoint):
+        """请求正常：速率加性增加"""
+        bucket = self.get_bucket(endpoint)
+        max_rate = self.rates.get(endpoint, self.rates["note"])[2]
+        with self.lock:
+            self.failures[endpoint] = 0
+            rate = min(max_rate, self.current_rates[endpoint] + self.increase_step)
+            self.current_rates[endpoint] = rate
+        bucket.set_rate(rate)
+    
+    def on_throttled(self, endpoint):
+        """被限流或出现验证码：速率乘性减少，并按指数退避暂停该类请求，返回退避秒数"""
+        bucket = self.get_bucket(endpoint)
+        min_rate = self.rates.get(endpoint, self.rates["note"])[1]
+        with self.lock:
+            failures = self.failures.get(endpoint, 0) + 1
+            self.failures[endpoint] = failures
+            rate = max(min_rate, self.current_rates[endpoint] * self.decrease_factor)
+            self.current_rates[endpoint] = rate
+            
+            # 带随机抖动的指数退避，避免多个线程同时恢复
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1)) * random.uniform(0.5, 1.5)
+            self.backoff_until[endpoint] = max(self.backoff_until.get(endpoint, 0), time.monotonic() + delay)
+        bucket.set_rate(rate)
+        
+        self.logger.warning(f"{endpoint} 请求被限流，速率降至 {rate:.2f} 次/秒，暂停 {delay:.1f} 秒")
+        return delay
+
+# 图片内容寻址存储
+def sniff_image_extension(head):
+    """根据文件头判断图片的真实格式，返回扩展名（含点），无法识别时按jpg处理"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return ".avif"
+        if brand in (b"heic", b"heix", b"hevc", b"hevx", b"mif1", b"msf1"):
+            return ".heic"
+    if head.startswith(b"BM"):
+        return ".bmp"
+    return ".jpg"
+
+def image_url_key(url):
+    """图片URL的去重键
+
+    小红书CDN的图片地址中，前面的路径段是随页面变化的时间戳/签名，只有最后一段
+    （图片ID及规格后缀）是稳定的，因此CDN图片按最后一段去重；其他地址去掉查询参数。
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.netloc.endswith("xhscdn.com"):
+        return "xhscdn:" + parts.path.rsplit("/", 1)[-1]
+    return parts.netloc + parts.path
+
+class SimpleImageStore:
+    def __init__(self, root, logger=None):
+        self.root = root
+        self.logger = logger or SimpleLogger()
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.index_path = os.path.join(root, "url_index.jsonl")
+        self.url_index = {}
+        self.key_locks = {}
+        self.lock = threading.Lock()
+        
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.load_index()
+    
+    def load_index(self):
+        """加载 URL -> 对象名 的索引（追加写入的JSONL，后出现的记录覆盖前面的）"""
+        if not os.path.exists(self.index_path):
+            return
+        
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.url_index[entry["key"]] = entry["object"]
+                except (ValueError, KeyError):
+                    # 忽略写入中断产生的半行
+                    continue
+    
+    def object_path(self, name):
+        """对象文件路径，按哈希前两位分目录"""
+        return os.path.join(self.objects_dir, name[:2], name)
+    
+    def temp_path(self, url):
+        """URL对应的下载临时文件，固定路径便于断点续传"""
+        return os.path.join(self.tmp_dir, hashlib.sha1(image_url_key(url).encode("utf-8")).hexdigest() + ".img")
+    
+    def key_lock(self, url):
+        """同一图片的锁，避免并发下载同一张图片写入同一个临时文件"""
+        with self.lock:
+            return self.key_locks.setdefault(image_url_key(url), threading.Lock())
+    
+    def lookup(self, url):
+        """查找URL已存储的对象名，对象文件不存在时返回None"""
+        with self.lock:
+            name = self.url_index.get(image_url_key(url))
+        if name and os.path.exists(self.object_path(name)):
+            return name
+        return None
+    
+    def add_file(self, url, file_path):
+        """将下载完成的文件移入存储，返回对象名（内容哈希 + 真实扩展名）"""
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            head = f.read(32)
+            sha256.update(head)
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        
+        name = sha256.hexdigest() + sniff_image_extension(head)
+        object_path = self.object_path(name)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        
+        # 相同内容只保存一份
+        if os.path.exists(object_path):
+            os.remove(file_path)
+        else:
+            os.replace(file_path, object_path)
+        
+        key = image_url_key(url)
+        with self.lock:
+            self.url_index[key] = name
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "object": name}) + "\n")
+        
+        return name
+    
+    def link(self, name, dest_base):
+        """在笔记目录中创建指向对象的硬链接（不支持时复制），返回文件路径"""
+        src = self.object_path(name)
+        dest = dest_base + os.path.splitext(name)[1]
+        
+        if os.path.exists(dest):
+            try:
+                if os.path.samefile(src, dest):
+                    return dest
+            except OSError:
+                pass
+        
+        tmp = dest + ".link"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+        return dest
+
+# 图片下载器
+class SimpleImageDownloader:
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, session, logger=None, rate_limiter=None, max_workers=8, max_bytes_per_second=0, store=None):
+        self.session = session
+        self.logger = logger or SimpleLogger()
+        self.rate_limiter = rate_limiter
+        self.store = store
+        # 所有笔记共用一个线程池，线程数即全局并发下载上限
+        self.executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="image")
+        # 全局带宽限制（字节/秒），0表示不限
+        self.bandwidth = SimpleTokenBucket(max_bytes_per_second) if max_bytes_per_second else None
+    
+    def download_many(self, tasks, headers=None):
+        """并行获取一组 (url, 不含扩展名的目标路径)，按输入顺序返回保存路径，失败的为None"""
+        futures = [self.executor.submit(self.fetch, url, dest_base, headers) for url, dest_base in tasks]
+        return [future.result() for future in futures]
+    
+    def fetch(self, url, dest_base, headers=None):
+        """获取一张图片：已在存储中的直接链接，否则下载后存入存储再链接"""
+        if not self.store:
+            return self.download(url, dest_base + ".jpg", headers)
+        
+        try:
+            with self.store.key_lock(url):
+                name = self.store.lookup(url)
+                if name:
+                    self.logger.info(f"图片已在本地存储中，跳过下载: {url}")
+                else:
+                    temp_path = self.download(url, self.store.temp_path(url), headers)
+                    if not temp_path:
+                        return None
+                    name = self.store.add_file(url, temp_path)
+            return self.store.link(name, dest_base)
+            
+        except Exception as e:
+            self.logger.error(f"保存图片出错: {str(e)}")
+            return None
+    
+    def download(self, url, path, headers=None):
+        """流式下载单个文件
+
+        分块写入 path.part，完整后原子重命名为 path；中断留下的 .part 文件
+        在下次下载时通过 Range 请求续传。
+        """
+        if os.path.exists(path):
+            return path
+        
+        part_path = path + ".part"
+        try:
+            self.logger.info(f"开始下载图片: {url}")
+            
+            for _ in range(2):
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                
+                # 续传需要按原始字节计算偏移，不接受压缩编码
+                request_headers = dict(headers or {})
+                request_headers["Accept-Encoding"] = "identity"
+                if offset:
+                    request_headers["Range"] = f"bytes={offset}-"
+                
+                if self.rate_limiter:
+                    self.rate_limiter.acquire("image")
+                
+                with self.session.get(url, headers=request_headers, stream=True, timeout=30) as response:
+                    if is_throttled_response(response):
+                        if self.rate_limiter:
+                            self.rate_limiter.on_throttled("image")
+                        continue
+                    if self.rate_limiter and response.status_code < 400:
+                        self.rate_limiter.on_success("image")
+                    
+                    if response.status_code == 416 and offset:
+                        # 临时文件与服务器内容不一致，删除后重新下载
+                        os.remove(part_path)
+                        continue
+                    
+                    if response.status_code == 206 and offset:
+                        mode = "ab"
+                    elif response.status_code == 200:
+                        mode = "wb"
+                    else:
+                        self.logger.error(f"下载图片失败: {response.status_code} {response.reason}")
+                        return None
+                    
+                    expected = response.headers.get("Content-Length")
+                    written = 0
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(self.CHUNK_SIZE):
+                            if not chunk:
+                                continue
+                            if self.bandwidth:
+                                self.bandwidth.acquire(len(chunk))
+                            f.write(chunk)
+                            written += len(chunk)
+                
+                if expected is not None and written < int(expected):
+                    self.logger.error(f"下载图片不完整，下次继续: {url}")
+                    return None
+                
+                os.replace(part_path, path)
+                self.logger.info(f"成功下载图片: {url}")
+                return path
+            
+            return None
+            
+        except Exception as e:
+            self.logger.error(f"下载图片出错: {str(e)}")
+            return None
+    
+    def close(self):
+        """关闭下载线程池"""
+        self.executor.shutdown(wait=False)
+
+# 用户资料缓存，跨运行保存，有效期内不重复请求用户主页
+class SimpleProfileCache:
+    def __init__(self, path=None, ttl_hours=24, logger=None):
+        self.path = path or os.path.join(CACHE_DIR, "user_profile_cache.json")
+        self.ttl = ttl_hours * 3600
+        self.logger = logger or SimpleLogger()
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """加载缓存文件，文件损坏时从空缓存开始"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except Exception as e:
+            self.logger.error(f"读取用户缓存失败，将重新获取: {str(e)}")
+    
+    def save(self):
+        """有变更时写回缓存文件，同时清理过期的用户"""
+        with self.lock:
+            if not self.dirty:
+                return
+            now = time.time()
+            self.entries = {
+                user_id: entry for user_id, entry in self.entries.items()
+                if isinstance(entry, dict) and now - entry.get("fetched_at", 0) < self.ttl
+            }
+            entries = dict(self.entries)
+            self.dirty = False
+        try:
+            write_json_atomic(self.path, entries)
+        except Exception as e:
+            self.logger.error(f"保存用户缓存失败: {str(e)}")
+    
+    def get(self, user_id):
+        """返回有效期内的用户，不存在或已过期时返回None"""
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if not isinstance(entry, dict) or not isinstance(entry.get("user"), dict):
+                return None
+            if time.time() - entry.get("fetched_at", 0) >= self.ttl:
+                return None
+            return User.from_dict(entry["user"])
+    
+    def put(self, user):
+        with self.lock:
+            self.entries[user.user_id] = {"user": user.to_dict(), "fetched_at": int(time.time())}
+            self.dirty = True
+
+def note_id_timestamp(note_id):
+    """笔记ID与MongoDB ObjectId格式相同，前8位十六进制是发布时间戳（秒）；无法解析时返回0"""
+    try:
+        return int(note_id[:8], 16) if len(note_id) == 24 else 0
+    except (TypeError, ValueError):
+        return 0
+
+def is_sticky_note(item):
+    """主页数据和 user_posted 接口中的置顶笔记（置顶笔记不按发布时间排列）"""
+    interact_info = item.get("interact_info") or (item.get("noteCard") or {}).get("interactInfo") or {}
+    return bool(interact_info.get("sticky"))
+
+def flatten_note_items(items, user_id=None):
+    """展开主页数据中按标签页嵌套的笔记列表，跳过不是字典的项和其他作者的笔记（收藏、点赞标签页）"""
+    result = []
+    for item in items or []:
+        if isinstance(item, list):
+            result.extend(flatten_note_items(item, user_id))
+        elif isinstance(item, dict):
+            author = ((item.get("noteCard") or {}).get("user") or {}).get("userId") or (item.get("user") or {}).get("user_id")
+            if user_id and author and author != user_id:
+                continue
+            result.append(item)
+    return result
+
+# 用户笔记水位：记录每个用户已提取到的最新笔记发布时间，定期重新提取时只取更新的笔记
+class SimpleWatermarkCache:
+    def __init__(self, path=None, logger=None):
+        self.path = path or os.path.join(CACHE_DIR, "user_note_watermarks.json")
+        self.logger = logger or SimpleLogger()
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """加载缓存文件，文件损坏时从空缓存开始"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except Exception as e:
+            self.logger.error(f"读取笔记水位失败，将提取全部笔记: {str(e)}")
+    
+    def save(self):
+        """有变更时写回缓存文件"""
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = dict(self.entries)
+            self.dirty = False
+        try:
+            write_json_atomic(self.path, entries)
+        except Exception as e:
+            self.logger.error(f"保存笔记水位失败: {str(e)}")
+    
+    def get(self, user_id):
+        """返回用户已提取的最新笔记发布时间戳，没有记录时返回None"""
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if not isinstance(entry, dict) or not isinstance(entry.get("published_at"), int):
+                return None
+            return entry["published_at"]
+    
+    def put(self, user_id, published_at):
+        """水位只前进不后退"""
+        with self.lock:
+            current = self.entries.get(user_id)
+            if isinstance(current, dict) and isinstance(current.get("published_at"), int) and current["published_at"] >= published_at:
+                return
+            self.entries[user_id] = {"published_at": published_at, "updated_at": int(time.time())}
+            self.dirty = True
 
 # 小红书提取器
 class SimpleXHSExtractor:
-    def __init__(self, cookie, output_dir="data/images", logger=None):
+    def __init__(self, cookie, output_dir="data/images", logger=None, rate_limiter=None, session=None,
+                 image_workers=8, max_bytes_per_second=0, image_store=None, note_store=None, profile_cache=None,
+                 max_workers=4):
         self.cookie = cookie
         self.output_dir = output_dir
         self.logger = logger or SimpleLogger()
+        self.rate_limiter = rate_limiter or SimpleAdaptiveRateLimiter(logger=self.logger)
+        # 连接池按并发数确定大小，避免线程多于连接时反复建连
+        self.session = session or create_session(
+            pool_sizes={"https://www.xiaohongshu.com": max(8, int(max_workers))},
+            default_pool_size=max(16, int(image_workers), int(max_workers))
+        )
         self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
         self.headers = {
             "User-Agent": self.user_agent,
@@ -121,9 +958,56 @@ class SimpleXHSExtractor:
             "Referer": "https://www.xiaohongshu.com/"
         }
         
+        # 可选的本地数据库，保存图片清单
+        self.note_store = note_store
+        
+        # 跨运行的用户资料缓存；本次运行中获取过的用户主页数据，extract_user 和 iter_user_note_ids 共用
+        self.profile_cache = profile_cache
+        self.profile_pages = {}
+        self.profile_locks = {}
+        self.profile_lock = threading.Lock()
+        
+        # 图片按内容存储在输出目录下，跨笔记、跨运行去重
+        self.image_store = image_store or SimpleImageStore(os.path.join(output_dir, ".image_store"), logger=self.logger)
+        self.image_downloader = SimpleImageDownloader(
+            self.session,
+            logger=self.logger,
+            rate_limiter=self.rate_limiter,
+            max_workers=image_workers,
+            max_bytes_per_second=max_bytes_per_second,
+            store=self.image_store
+        )
+        
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
     
+    def close(self):
+        """释放下载线程池和连接"""
+        self.image_downloader.close()
+        self.session.close()
+    
+    def request(self, endpoint, url, max_retries=3, **kwargs):
+        """经限速器发送GET请求，遇到限流或验证码时降速、退避后重试"""
+        kwargs.setdefault("headers", self.headers)
+        kwargs.setdefault("timeout", 30)
+        
+        for attempt in range(max_retries + 1):
+            self.rate_limiter.acquire(endpoint)
+            response = self.session.get(url, **kwargs)
+            
+            if not is_throttled_response(response):
+                if response.status_code < 400:
+                    self.rate_limiter.on_success(endpoint)
+                return response
+            
+            # 退避时间由限速器统一控制，下一次acquire时等待
+            self.rate_limiter.on_throttled(endpoint)
+            if attempt < max_retries:
+                response.close()
+        
+        self.logger.error(f"请求多次被限流，放弃: {url}")
+        return response
+    
     def extract_note_id(self, url_or_id):
         """从URL或ID中提取笔记ID"""
         if not url_or_id:
@@ -172,60 +1056,22 @@ class SimpleXHSExtractor:
             api_url = f"https://www.xiaohongshu.com/explore/{note_id}"
             
             # 发送请求
-            response = requests.get(api_url, headers=self.headers, timeout=30)
+            response = self.request("note", api_url)
             
             if response.status_code != 200:
                 self.logger.error(f"提取笔记失败: {response.status_code} {response.reason}")
                 return None
             
-            # 解析HTML
-            soup = BeautifulSoup(response.text, 'lxml')
-            
             # 提取JSON数据
-            script_tags = soup.find_all('script')
-            note_data = None
-            
-            for script in script_tags:
-                if script.string and 'window.__INITIAL_STATE__' in script.string:
-                    json_str = script.string.split('window.__INITIAL_STATE__=')[1].split(';')[0]
-                    data = json.loads(json_str)
-                    if 'note' in data and 'noteData' in data['note']:
-                        note_data = data['note']['noteData']
-                        break
+            data = extract_initial_state(response.content) or {}
+            note_data = (data.get('note') or {}).get('noteData')
             
             if not note_data:
                 self.logger.error(f"未找到笔记数据: {note_id}")
                 return None
             
             # 创建笔记对象
-            note = Note()
-            note.note_id = note_id
-            note.title = note_data.get('title', '')
-            note.desc = note_data.get('desc', '')
-            note.user_id = note_data.get('userId', '')
-            note.nickname = note_data.get('nickname', '')
-            note.avatar = note_data.get('avatar', '')
-            note.ip_location = note_data.get('ipLocation', '')
-            note.liked_count = note_data.get('likedCount', 0)
-            note.collected_count = note_data.get('collectedCount', 0)
-            note.comment_count = note_data.get('commentCount', 0)
-            note.share_count = note_data.get('shareCount', 0)
-            
-            # 提取图片列表
-            if 'imageList' in note_data:
-                for img in note_data['imageList']:
-                    if 'url' in img:
-                        note.image_list.append(img['url'])
-            
-            # 提取标签列表
-            if 'tagList' in note_data:
-                for tag in note_data['tagList']:
-                    if 'name' in tag:
-                        note.tag_list.append(tag['name'])
-            
-            # 提取发布时间
-            if 'time' in note_data:
-                note.upload_time = note_data['time']
+            note = Note.from_payload(note_id, note_data)
             
             self.logger.info(f"成功提取笔记: {note.title}")
             
@@ -239,6 +1085,40 @@ class SimpleXHSExtractor:
             self.logger.error(f"提取笔记出错: {str(e)}")
             return None
     
+    def fetch_user_profile(self, user_id):
+        """请求用户主页，返回页面中的 user 数据；本次运行中同一用户只请求一次"""
+        with self.profile_lock:
+            if user_id in self.profile_pages:
+                return self.profile_pages[user_id]
+            lock = self.profile_locks.setdefault(user_id, threading.Lock())
+        
+        # 同一用户并发请求时只有一个线程真正发出请求
+        with lock:
+            with self.profile_lock:
+                if user_id in self.profile_pages:
+                    return self.profile_pages[user_id]
+            
+            # 构建API URL
+            api_url = f"https://www.xiaohongshu.com/user/profile/{user_id}"
+            
+            # 发送请求
+            response = self.request("user", api_url)
+            
+            if response.status_code != 200:
+                self.logger.error(f"获取用户主页失败: {response.status_code} {response.reason}")
+                return None
+            
+            # 提取JSON数据，只保留用户资料和笔记列表
+            data = extract_initial_state(response.content) or {}
+            user_state = data.get('user') or {}
+            page = {
+                "userPageData": user_state.get('userPageData'),
+                "notes": user_state.get('notes')
+            }
+            with self.profile_lock:
+                self.profile_pages[user_id] = page
+            return page
+    
     def extract_user(self, url_or_id):
         """提取用户信息"""
         user_id = self.extract_user_id(url_or_id)
@@ -246,49 +1126,29 @@ class SimpleXHSExtractor:
             self.logger.error(f"无效的用户URL或ID: {url_or_id}")
             return None
         
+        # 有效期内的缓存直接使用
+        if self.profile_cache:
+            user = self.profile_cache.get(user_id)
+            if user:
+                self.logger.info(f"使用缓存的用户信息: {user.nickname}")
+                return user
+        
         self.logger.info(f"开始提取用户信息: {user_id}")
         
         try:
-            # 构建API URL
-            api_url = f"https://www.xiaohongshu.com/user/profile/{user_id}"
-            
-            # 发送请求
-            response = requests.get(api_url, headers=self.headers, timeout=30)
-            
-            if response.status_code != 200:
-                self.logger.error(f"提取用户信息失败: {response.status_code} {response.reason}")
+            page = self.fetch_user_profile(user_id)
+            if page is None:
                 return None
             
-            # 解析HTML
-            soup = BeautifulSoup(response.text, 'lxml')
-            
-            # 提取JSON数据
-            script_tags = soup.find_all('script')
-            user_data = None
-            
-            for script in script_tags:
-                if script.string and 'window.__INITIAL_STATE__' in script.string:
-                    json_str = script.string.split('window.__INITIAL_STATE__=')[1].split(';')[0]
-                    data = json.loads(json_str)
-                    if 'user' in data and 'userPageData' in data['user']:
-                        user_data = data['user']['userPageData']
-                        break
-            
+            user_data = page["userPageData"]
             if not user_data:
                 self.logger.error(f"未找到用户数据: {user_id}")
                 return None
             
             # 创建用户对象
-            user = User()
-            user.user_id = user_id
-            user.nickname = user_data.get('nickname', '')
-            user.avatar = user_data.get('images', '')
-            user.desc = user_data.get('desc', '')
-            user.gender = user_data.get('gender', 0)
-            user.follows = user_data.get('follows', 0)
-            user.fans = user_data.get('fans', 0)
-            user.notes_count = user_data.get('notes', 0)
-            user.location = user_data.get('location', '')
+            user = User.from_payload(user_id, user_data)
+            if self.profile_cache:
+                self.profile_cache.put(user)
             
             self.logger.info(f"成功提取用户信息: {user.nickname}")
             return user
@@ -298,162 +1158,859 @@ class SimpleXHSExtractor:
             return None
     
     def search_notes(self, keyword, sort_type=0, limit=20):
-        """搜索笔记"""
+        """搜索笔记，返回笔记ID列表"""
+        note_ids = list(self.iter_search_notes(keyword, sort_type=sort_type, limit=limit))
+        self.logger.info(f"搜索结果: 找到 {len(note_ids)} 个笔记")
+        return note_ids
+    
+    def iter_search_notes(self, keyword, sort_type=0, limit=20, max_pages=50, state=None):
+        """逐页搜索笔记，按页产出去重后的笔记ID
+
+        取到 limit 个（为None时不限）、某一页没有新笔记或达到 max_pages 页时停止。
+        调用方边取边提取时，后面的页在前面的笔记提取过程中才请求。
+        state 为字典时，停止后写入 state["stopped"]：limit / exhausted / max_pages / error。
+        """
+        state = {} if state is None else state
+        state["stopped"] = None
+        
         self.logger.info(f"搜索笔记: {keyword}")
+        seen = set()
+        count = 0
         
-        try:
-            # 构建API URL
-            api_url = f"https://www.xiaohongshu.com/search_result?keyword={urllib.parse.quote(keyword)}&sort={sort_type}&page=1"
-            
-            # 发送请求
-            response = requests.get(api_url, headers=self.headers, timeout=30)
-            
-            if response.status_code != 200:
-                self.logger.error(f"搜索笔记失败: {response.status_code} {response.reason}")
-                return []
-            
-            # 解析HTML
-            soup = BeautifulSoup(response.text, 'lxml')
-            
-            # 提取JSON数据
-            script_tags = soup.find_all('script')
-            search_data = None
-            
-            for script in script_tags:
-                if script.string and 'window.__INITIAL_STATE__' in script.string:
-                    json_str = script.string.split('window.__INITIAL_STATE__=')[1].split(';')[0]
-                    data = json.loads(json_str)
-                    if 'search' in data and 'items' in data['search']:
-                        search_data = data['search']['items']
-                        break
+        for page in range(1, max_pages + 1):
+            try:
+                # 构建API URL
+                api_url = f"https://www.xiaohongshu.com/search_result?keyword={urllib.parse.quote(keyword)}&sort={sort_type}&page={page}"
+                
+                # 发送请求
+                response = self.request("search", api_url)
+                
+                if response.status_code != 200:
+                    self.logger.error(f"搜索笔记失败: {response.status_code} {response.reason}")
+                    state["stopped"] = "error"
+                    return
+                
+                # 提取JSON数据
+                data = extract_initial_state(response.content) or {}
+                search_data = (data.get('search') or {}).get('items')
+                
+            except Exception as e:
+                self.logger.error(f"搜索笔记出错: {str(e)}")
+                state["stopped"] = "error"
+                return
             
             if not search_data:
-                self.logger.error(f"未找到搜索结果: {keyword}")
-                return []
+                if page == 1:
+                    self.logger.error(f"未找到搜索结果: {keyword}")
+                state["stopped"] = "exhausted"
+                return
             
-            # 提取笔记ID
-            note_ids = []
+            # 提取笔记ID，跳过前几页已出现过的笔记
+            new_ids = []
             for item in search_data:
-                if 'id' in item and len(note_ids) < limit:
-                    note_ids.append(item['id'])
+                note_id = item.get('id')
+                if note_id and note_id not in seen:
+                    seen.add(note_id)
+                    new_ids.append(note_id)
             
-            self.logger.info(f"搜索结果: 找到 {len(note_ids)} 个笔记")
-            return note_ids
+            if not new_ids:
+                state["stopped"] = "exhausted"
+                return
+            self.logger.info(f"搜索第 {page} 页: {len(new_ids)} 个新笔记")
             
-        except Exception as e:
-            self.logger.error(f"搜索笔记出错: {str(e)}")
-            return []
+            for note_id in new_ids:
+                yield note_id
+                count += 1
+                if limit and count >= limit:
+                    state["stopped"] = "limit"
+                    return
+        
+        state["stopped"] = "max_pages"
     
     def extract_user_notes(self, user_id, limit=20):
         """提取用户的笔记"""
+        note_ids = self.list_user_note_ids(user_id, limit)
+        
+        # 提取笔记详情
+        notes = []
+        for note_id in note_ids:
+            note = self.extract_note(note_id)
+            if note:
+                notes.append(note)
+        
+        self.logger.info(f"成功提取 {len(notes)} 个用户笔记")
+        return notes
+    
+    def list_user_note_ids(self, user_id, limit=20):
+        """获取用户笔记ID列表"""
+        return list(self.iter_user_note_ids(user_id, limit=limit))
+    
+    def iter_user_note_ids(self, user_id, limit=20, since=None, page_size=30, max_pages=100, state=None):
+        """从新到旧逐页产出用户的笔记ID
+
+        先使用主页中已有的第一屏笔记，再按游标请求 user_posted 接口翻页。
+        翻页请求没有 x-s / x-t 签名，只是尽力而为：通常会被拒绝，此时只能取到第一屏，
+        state["stopped"] 为 error。
+        取到 limit 个（为None时不限）、没有更多笔记或达到 max_pages 页时停止。
+        since 为发布时间戳时只产出之后发布的笔记，遇到更早的非置顶笔记即停止，不必翻完全部历史。
+        state 为字典时，停止后写入 state["stopped"]：limit / since / exhausted / max_pages / error。
+        """
+        state = {} if state is None else state
+        state["stopped"] = None
+        
         user_id = self.extract_user_id(user_id)
         if not user_id:
             self.logger.error(f"无效的用户ID: {user_id}")
-            return []
+            state["stopped"] = "error"
+            return
         
         self.logger.info(f"提取用户笔记: {user_id}")
         
+        # 与 extract_user 共用本次运行中已获取的用户主页
         try:
-            # 构建API URL
-            api_url = f"https://www.xiaohongshu.com/user/profile/{user_id}"
-            
-            # 发送请求
-            response = requests.get(api_url, headers=self.headers, timeout=30)
-            
-            if response.status_code != 200:
-                self.logger.error(f"提取用户笔记失败: {response.status_code} {response.reason}")
-                return []
-            
-            # 解析HTML
-            soup = BeautifulSoup(response.text, 'lxml')
-            
-            # 提取JSON数据
-            script_tags = soup.find_all('script')
-            notes_data = None
-            
-            for script in script_tags:
-                if script.string and 'window.__INITIAL_STATE__' in script.string:
-                    json_str = script.string.split('window.__INITIAL_STATE__=')[1].split(';')[0]
-                    data = json.loads(json_str)
-                    if 'user' in data and 'notes' in data['user']:
-                        notes_data = data['user']['notes']
-                        break
-            
-            if not notes_data:
-                self.logger.error(f"未找到用户笔记: {user_id}")
-                return []
-            
-            # 提取笔记ID
-            note_ids = []
-            for note in notes_data:
-                if 'id' in note and len(note_ids) < limit:
-                    note_ids.append(note['id'])
-            
-            # 提取笔记详情
-            notes = []
-            for note_id in note_ids:
-                note = self.extract_note(note_id)
-                if note:
-                    notes.append(note)
-                    time.sleep(random.uniform(1, 2))  # 随机延迟，避免请求过快
-            
-            self.logger.info(f"成功提取 {len(notes)} 个用户笔记")
-            return notes
-            
+            page = self.fetch_user_profile(user_id) or {}
         except Exception as e:
             self.logger.error(f"提取用户笔记出错: {str(e)}")
-            return []
+            page = {}
+        
+        # 主页数据中的笔记按标签页嵌套（每个标签页一个列表）
+        items = flatten_note_items(page.get("notes"), user_id)
+        cursor = ""
+        has_more = True
+        seen = set()
+        count = 0
+        
+        for page_number in range(1, max_pages + 1):
+            if page_number > 1 or not items:
+                if not has_more:
+                    state["stopped"] = "exhausted"
+                    break
+                try:
+                    # 游标为上一页最后一个笔记ID；未签名的请求，被拒绝时只保留已取到的笔记
+                    api_url = (f"https://edith.xiaohongshu.com/api/sns/web/v1/user_posted?num={page_size}"
+                               f"&cursor={cursor}&user_id={user_id}&image_formats=jpg,webp,avif")
+                    response = self.request("user", api_url)
+                    
+                    if response.status_code != 200:
+                        self.logger.error(f"获取用户笔记失败: {response.status_code} {response.reason}")
+                        state["stopped"] = "error"
+                        break
+                    
+                    result = response.json()
+                except Exception as e:
+                    self.logger.error(f"获取用户笔记出错: {str(e)}")
+                    state["stopped"] = "error"
+                    break
+                
+                # 风控或签名校验失败时 data 为空，不能当作没有更多笔记
+                if result.get("success") is False or result.get("code") not in (0, None):
+                    self.logger.error(f"获取用户笔记失败: {result.get('code')} {result.get('msg')}")
+                    state["stopped"] = "error"
+                    break
+                
+                data = result.get("data") or {}
+                items = flatten_note_items(data.get("notes"), user_id)
+                has_more = bool(data.get("has_more"))
+            
+            new_ids = 0
+            for item in items:
+                note_id = item.get("note_id") or item.get("id")
+                if not note_id or note_id in seen:
+                    continue
+                seen.add(note_id)
+                cursor = note_id
+                new_ids += 1
+                
+                # 已提取过的时间之前的笔记，置顶的跳过，其余说明已经翻到上次的位置
+                published_at = note_id_timestamp(note_id)
+                if since and published_at and published_at <= since:
+                    if is_sticky_note(item):
+                        continue
+                    self.logger.info(f"已到达上次提取的位置，共 {count} 个新笔记")
+                    state["stopped"] = "since"
+                    return
+                
+                yield note_id
+                count += 1
+                if limit and count >= limit:
+                    state["stopped"] = "limit"
+                    return
+            
+            if not new_ids:
+                state["stopped"] = "exhausted"
+                break
+            self.logger.info(f"用户笔记第 {page_number} 页: {new_ids} 个笔记")
+        else:
+            state["stopped"] = "max_pages"
+        
+        if not count and not since:
+            self.logger.error(f"未找到用户笔记: {user_id}")
+    
+    def get_note_dir(self, note):
+        """笔记图片目录"""
+        return os.path.join(self.output_dir, f"{note.nickname}_{note.user_id}", f"{note.title}_{note.note_id}")
     
     def download_images(self, note):
-        """下载笔记中的图片"""
+        """下载笔记中的图片，返回成功保存的图片路径"""
         if not note or not note.image_list:
-            return
+            return []
         
         # 创建笔记目录
-        note_dir = os.path.join(self.output_dir, f"{note.nickname}_{note.user_id}", f"{note.title}_{note.note_id}")
+        note_dir = self.get_note_dir(note)
         os.makedirs(note_dir, exist_ok=True)
         
-        for i, img_url in enumerate(note.image_list):
-            try:
-                self.logger.info(f"开始下载图片: {img_url}")
-                
-                # 发送请求
-                response = requests.get(img_url, headers={"User-Agent": self.user_agent}, timeout=30)
-                
-                if response.status_code != 200:
-                    self.logger.error(f"下载图片失败: {response.status_code} {response.reason}")
+        # 同一笔记的图片并行下载，并发数和带宽由下载器全局控制
+        tasks = [(img_url, os.path.join(note_dir, f"image_{i}")) for i, img_url in enumerate(note.image_list)]
+        results = self.image_downloader.download_many(tasks, headers={"User-Agent": self.user_agent})
+        
+        # 写入清单，记录每张图片对应的存储对象和实际文件名
+        manifest = {
+            "note_id": note.note_id,
+            "images": [
+                {
+                    "index": i,
+                    "url": img_url,
+                    "file": os.path.basename(path) if path else None,
+                    "object": self.image_store.lookup(img_url) if path else None
+                }
+                for i, (img_url, path) in enumerate(zip(note.image_list, results))
+            ]
+        }
+        with open(os.path.join(note_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        if self.note_store:
+            self.note_store.add_image_manifest(note.note_id, manifest)
+        
+        saved = [path for path in results if path]
+        if len(saved) < len(tasks):
+            self.logger.error(f"笔记 {note.note_id} 有 {len(tasks) - len(saved)} 张图片下载失败")
+        return saved
+    
+    def get_image_paths(self, note):
+        """返回笔记已下载图片的本地路径，优先读取清单，兼容旧版的 image_{i}.jpg"""
+        note_dir = self.get_note_dir(note)
+        manifest_path = os.path.join(note_dir, "manifest.json")
+        
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            paths = [os.path.join(note_dir, image["file"]) for image in manifest.get("images", []) if image.get("file")]
+        else:
+            paths = [os.path.join(note_dir, f"image_{i}.jpg") for i in range(len(note.image_list))]
+        
+        return [path for path in paths if os.path.exists(path)]
+
+# 断点续传日志
+CHECKPOINT_DIR = os.path.join("data", "checkpoints")
+
+class SimpleCheckpointJournal:
+    def __init__(self, path, reset=False, logger=None):
+        self.path = path
+        self.logger = logger or SimpleLogger()
+        # {类型: {ID: 状态}}，状态为 pending / done / failed；upload 记录已写入飞书的笔记
+        self.status = {"note": {}, "user": {}, "upload": {}}
+        # 已完成条目的数据，只在加载时填充，用于恢复结果
+        self.done_data = {"note": {}, "user": {}, "upload": {}}
+        self.lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if reset and os.path.exists(path):
+            os.remove(path)
+        self.load()
+        self.file = open(path, "a", encoding="utf-8")
+        
+        # 上次崩溃留下的半行需要先换行，否则新记录会接在半行后面
+        if self.file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+    
+    @staticmethod
+    def job_path(mode, target):
+        """根据提取模式和目标（URL、关键词、用户ID或文件）确定日志文件"""
+        key = hashlib.sha1(f"{mode}:{target}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(CHECKPOINT_DIR, f"{mode}_{key}.jsonl")
+    
+    def load(self):
+        """读取已有日志，同一条目以最后一条记录为准"""
+        if not os.path.exists(self.path):
+            return
+        
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    kind, item_id, status = entry["kind"], entry["id"], entry["status"]
+                except (ValueError, KeyError):
+                    # 崩溃时可能留下不完整的最后一行
                     continue
-                
-                # 保存图片
-                img_path = os.path.join(note_dir, f"image_{i}.jpg")
-                with open(img_path, "wb") as f:
-                    f.write(response.content)
-                
-                self.logger.info(f"成功下载图片: {img_path}")
-                
-            except Exception as e:
-                self.logger.error(f"下载图片出错: {str(e)}")
+                if kind not in self.status:
+                    continue
+                self.status[kind][item_id] = status
+                if status == "done" and "data" in entry:
+                    self.done_data[kind][item_id] = entry["data"]
+                else:
+                    self.done_data[kind].pop(item_id, None)
+    
+    def write(self, entries):
+        """追加日志并立即刷新到磁盘"""
+        with self.lock:
+            for entry in entries:
+                self.status[entry["kind"]][entry["id"]] = entry["status"]
+                self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+    
+    def mark_pending(self, kind, item_ids):
+        """登记待处理的条目（已完成的除外）"""
+        self.write([
+            {"kind": kind, "id": item_id, "status": "pending"}
+            for item_id in item_ids if not self.is_done(kind, item_id)
+        ])
+    
+    def mark_done(self, kind, item_id, data):
+        self.write([{"kind": kind, "id": item_id, "status": "done", "data": data}])
+    
+    def mark_done_many(self, kind, item_ids):
+        """一次登记多个不带数据的已完成条目"""
+        self.write([{"kind": kind, "id": item_id, "status": "done"} for item_id in item_ids])
+    
+    def mark_failed(self, kind, item_id):
+        self.write([{"kind": kind, "id": item_id, "status": "failed"}])
+    
+    def is_done(self, kind, item_id):
+        with self.lock:
+            return self.status[kind].get(item_id) == "done"
+    
+    def restore(self):
+        """返回日志中已完成的 (笔记列表, 用户字典)"""
+        notes = [Note.from_dict(data) for data in self.done_data["note"].values()]
+        users = {user_id: User.from_dict(data) for user_id, data in self.done_data["user"].items()}
+        return notes, users
+    
+    def summary(self):
+        """各状态的笔记数量"""
+        with self.lock:
+            counts = {"pending": 0, "done": 0, "failed": 0}
+            for status in self.status["note"].values():
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+    
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# 本地SQLite数据库，跨运行保存笔记、用户、图片清单和飞书记录映射
+NOTE_DB_PATH = os.path.join("data", "xhs.db")
+
+NOTE_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    note_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    title TEXT,
+    upload_time,
+    liked_count INTEGER,
+    collected_count INTEGER,
+    comment_count INTEGER,
+    data TEXT NOT NULL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_notes_user_id ON notes(user_id);
+CREATE INDEX IF NOT EXISTS idx_notes_upload_time ON notes(upload_time);
+CREATE TABLE IF NOT EXISTS note_keywords (
+    keyword TEXT NOT NULL,
+    note_id TEXT NOT NULL,
+    PRIMARY KEY (keyword, note_id)
+);
+CREATE INDEX IF NOT EXISTS idx_note_keywords_note_id ON note_keywords(note_id);
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    nickname TEXT,
+    fans INTEGER,
+    data TEXT NOT NULL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS image_manifests (
+    note_id TEXT PRIMARY KEY,
+    manifest TEXT NOT NULL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS feishu_records (
+    app_token TEXT NOT NULL,
+    table_id TEXT NOT NULL,
+    note_id TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    fingerprint TEXT,
+    updated_at REAL,
+    PRIMARY KEY (app_token, table_id, note_id)
+);
+"""
+
+class SimpleNoteStore:
+    # 每张表的写入语句，写入先缓存，攒够 batch_size 条后在一个事务中批量写入
+    STATEMENTS = {
+        "notes": "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        "note_keywords": "INSERT OR IGNORE INTO note_keywords VALUES (?, ?)",
+        "users": "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)",
+        "image_manifests": "INSERT OR REPLACE INTO image_manifests VALUES (?, ?, ?)",
+        "feishu_records": "INSERT OR REPLACE INTO feishu_records VALUES (?, ?, ?, ?, ?, ?)"
+    }
+    
+    def __init__(self, path=NOTE_DB_PATH, batch_size=200, logger=None):
+        import sqlite3
+        
+        self.path = path
+        self.batch_size = batch_size
+        self.logger = logger or SimpleLogger()
+        self.pending = {table: [] for table in self.STATEMENTS}
+        self.pending_count = 0
+        self.lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 提取线程和下载线程都会写入，由 self.lock 串行化
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(NOTE_DB_SCHEMA)
+    
+    def add(self, table, rows):
+        with self.lock:
+            self.pending[table].extend(rows)
+            self.pending_count += len(rows)
+            if self.pending_count >= self.batch_size:
+                self._flush()
+    
+    def flush(self):
+        with self.lock:
+            self._flush()
+    
+    def _flush(self):
+        if not self.pending_count:
+            return
+        try:
+            with self.conn:
+                for table, rows in self.pending.items():
+                    if rows:
+                        self.conn.executemany(self.STATEMENTS[table], rows)
+        except Exception as e:
+            self.logger.error(f"写入本地数据库出错: {str(e)}")
+        for rows in self.pending.values():
+            rows.clear()
+        self.pending_count = 0
+    
+    def add_note(self, note, keyword=None, note_dict=None):
+        note_dict = note_dict or note.to_dict()
+        rows = [(note.note_id, note.user_id, note.title, note.upload_time, note.liked_count, note.collected_count,
+                 note.comment_count, json.dumps(note_dict, ensure_ascii=False), time.time())]
+        self.add("notes", rows)
+        if keyword:
+            self.add("note_keywords", [(keyword, note.note_id)])
+    
+    def add_user(self, user, user_dict=None):
+        user_dict = user_dict or user.to_dict()
+        self.add("users", [(user.user_id, user.nickname, user.fans, json.dumps(user_dict, ensure_ascii=False), time.time())])
+    
+    def add_image_manifest(self, note_id, manifest):
+        self.add("image_manifests", [(note_id, json.dumps(manifest, ensure_ascii=False), time.time())])
+    
+    def add_feishu_records(self, app_token, table_id, index):
+        """保存飞书记录映射，index 为 {笔记ID: {"record_id": ..., "fingerprint": ...}}"""
+        now = time.time()
+        self.add("feishu_records", [
+            (app_token, table_id, note_id, item["record_id"], item.get("fingerprint"), now)
+            for note_id, item in index.items() if item.get("record_id")
+        ])
+    
+    def query(self, sql, params=()):
+        """先写入缓存的数据再查询"""
+        with self.lock:
+            self._flush()
+            return self.conn.execute(sql, params).fetchall()
+    
+    def has_note(self, note_id):
+        return bool(self.query("SELECT 1 FROM notes WHERE note_id = ?", (note_id,)))
+    
+    def get_note(self, note_id):
+        rows = self.query("SELECT data FROM notes WHERE note_id = ?", (note_id,))
+        return Note.from_dict(json.loads(rows[0][0])) if rows else None
+    
+    def query_notes(self, keyword=None, user_id=None, since=None, limit=None):
+        """按关键词、作者、发布时间（不早于 since）查询笔记，按发布时间倒序"""
+        sql = "SELECT notes.data FROM notes"
+        conditions, params = [], []
+        if keyword:
+            sql += " JOIN note_keywords ON note_keywords.note_id = notes.note_id"
+            conditions.append("note_keywords.keyword = ?")
+            params.append(keyword)
+        if user_id:
+            conditions.append("notes.user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            conditions.append("notes.upload_time >= ?")
+            params.append(since)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY notes.upload_time DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [Note.from_dict(json.loads(data)) for data, in self.query(sql, params)]
+    
+    def get_user(self, user_id):
+        rows = self.query("SELECT data FROM users WHERE user_id = ?", (user_id,))
+        return User.from_dict(json.loads(rows[0][0])) if rows else None
+    
+    def get_image_manifest(self, note_id):
+        rows = self.query("SELECT manifest FROM image_manifests WHERE note_id = ?", (note_id,))
+        return json.loads(rows[0][0]) if rows else None
+    
+    def load_feishu_index(self, app_token, table_id):
+        """上次同步时记录的 {笔记ID: {"record_id": ..., "fingerprint": ...}}"""
+        rows = self.query(
+            "SELECT note_id, record_id, fingerprint FROM feishu_records WHERE app_token = ? AND table_id = ?",
+            (app_token, table_id)
+        )
+        return {note_id: {"record_id": record_id, "fingerprint": fingerprint} for note_id, record_id, fingerprint in rows}
+    
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.conn.close()
+
+# 流式输出（JSONL / CSV / Parquet）
+def stream_output_paths(output_file, ext):
+    """由输出文件名得到笔记和用户的输出文件路径"""
+    base = os.path.splitext(output_file)[0]
+    return base + ext, base + ".users" + ext
+
+def scan_jsonl(path, key):
+    """返回JSONL文件中已有记录的 key 值集合，并截掉中断写入时留下的不完整的最后一行"""
+    keys = set()
+    if not os.path.exists(path):
+        return keys
+    with open(path, "rb+") as f:
+        complete = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            complete += len(line)
+            try:
+                keys.add(json.loads(line).get(key))
+            except (ValueError, AttributeError):
                 continue
-            
-            # 随机延迟，避免请求过快
-            time.sleep(random.uniform(0.5, 1.5))
+        f.truncate(complete)
+    return keys
+
+class SimpleJsonlWriter:
+    def __init__(self, path, append=False, flush_every=20, flush_interval=2.0, key=None):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.count = 0
+        self.lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 追加时记下文件中已有的记录，续传时据此补写缺少的结果
+        self.keys = scan_jsonl(path, key) if append and key else set()
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+        
+        # 长时间没有新行（如限流退避）时也按时刷新，边写边读的程序能及时看到
+        self.closed = threading.Event()
+        threading.Thread(target=self.flush_loop, name="jsonl-flush", daemon=True).start()
+    
+    def write(self, obj):
+        """追加一行JSON，每 flush_every 行或每 flush_interval 秒刷新一次，便于其他程序边写边读"""
+        line = json.dumps(obj, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.count += 1
+            self.pending += 1
+            now = time.monotonic()
+            if self.pending >= self.flush_every or now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.pending = 0
+                self.last_flush = now
+    
+    def flush_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            with self.lock:
+                if self.pending and not self.file.closed:
+                    self.file.flush()
+                    self.pending = 0
+                    self.last_flush = time.monotonic()
+    
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+def load_pyarrow():
+    """pyarrow 是可选依赖，未安装时返回None"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+class SimpleColumnarWriter:
+    """按 Note / User 的字段分列写入CSV或Parquet，每 chunk_size 行写一次"""
+    
+    # 与记录中类型不同的列：发布时间统一写为毫秒时间戳
+    COLUMN_KINDS = {"upload_time": "epoch_ms"}
+    
+    def __init__(self, path, record_cls, chunk_size=10000):
+        self.path = path
+        self.record_cls = record_cls
+        self.kinds = [self.COLUMN_KINDS.get(name, kind) for name, kind, _ in record_cls.FIELDS]
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.count = 0
+        self.lock = threading.Lock()
+        self.parquet_writer = None
+        self.csv_file = None
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if path.endswith(".parquet"):
+            self.pa = load_pyarrow()
+            self.schema = self.pa.schema([
+                (name, self.arrow_type(kind)) for name, kind in zip(record_cls.FIELD_NAMES, self.kinds)
+            ])
+            self.parquet_writer = self.pa.parquet.ParquetWriter(path, self.schema)
+        else:
+            import csv
+            self.csv_file = open(path, "w", encoding="utf-8", newline="")
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow(record_cls.FIELD_NAMES)
+    
+    def arrow_type(self, kind):
+        if kind is int or kind == "epoch_ms":
+            return self.pa.int64()
+        if kind is list:
+            return self.pa.list_(self.pa.string())
+        return self.pa.string()
+    
+    def write(self, obj):
+        """写入一个笔记或用户（to_dict 的结果）"""
+        with self.lock:
+            self.rows.append([obj.get(name) for name in self.record_cls.FIELD_NAMES])
+            self.count += 1
+            if len(self.rows) >= self.chunk_size:
+                self.flush_rows()
+    
+    def flush_rows(self):
+        rows, self.rows = self.rows, []
+        if not rows:
+            return
+        
+        types = self.kinds
+        epoch_columns = [i for i, kind in enumerate(types) if kind == "epoch_ms"]
+        for row in rows:
+            for i in epoch_columns:
+                row[i] = parse_epoch_ms(row[i])
+        
+        if self.parquet_writer:
+            # 按列组装成一个行组写入
+            columns = []
+            for i, kind in enumerate(types):
+                values = [row[i] for row in rows]
+                if kind is None:
+                    values = [None if value is None else str(value) for value in values]
+                columns.append(values)
+            self.parquet_writer.write_table(self.pa.Table.from_arrays(
+                [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+                schema=self.schema
+            ))
+        else:
+            # CSV中列表字段写为JSON数组
+            for row in rows:
+                for i, kind in enumerate(types):
+                    if kind is list:
+                        row[i] = json.dumps(row[i] or [], ensure_ascii=False)
+            self.csv_writer.writerows(rows)
+            self.csv_file.flush()
+    
+    def close(self):
+        with self.lock:
+            self.flush_rows()
+            if self.parquet_writer:
+                self.parquet_writer.close()
+                self.parquet_writer = None
+            if self.csv_file and not self.csv_file.closed:
+                self.csv_file.close()
+
+# 并发提取引擎
+class SimpleExtractionEngine:
+    def __init__(self, extractor, max_workers=4, logger=None):
+        self.extractor = extractor
+        self.max_workers = max(1, int(max_workers))
+        self.logger = logger or extractor.logger
+        self.lock = threading.Lock()
+
+    def run(self, items, users=None, total=None, is_running=None, on_progress=None, on_note=None, on_failed=None, on_user=None,
+            keep_results=True):
+        """并发提取笔记及作者信息，返回 (notes, users)
+
+        items 可以是列表或生成器，按需取用，同时在途的任务数不超过 max_workers 的两倍。
+        is_running 返回False时不再提交新任务，已在途的任务正常结束。
+        items 迭代时抛出的异常在在途任务全部完成并回调之后重新抛出。
+        on_note / on_failed 在调用线程中按完成顺序回调，on_user 在工作线程中回调。
+        keep_results 为False时不在内存中保留笔记（结果只通过 on_note 流出）。
+        """
+        users = {} if users is None else users
+        is_running = is_running or (lambda: True)
+        if total is None and hasattr(items, "__len__"):
+            total = len(items)
+
+        notes = []
+        pending_users = set()
+        items = iter(items)
+        futures = {}
+        submitted = 0
+        done = 0
+        exhausted = False
+        items_error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # 补充任务，保持有限的在途数量
+                while not exhausted and len(futures) < self.max_workers * 2 and is_running():
+                    try:
+                        item = next(items, None)
+                    except Exception as e:
+                        # 不再取新任务，先等在途的任务完成并写入结果
+                        self.logger.error(f"获取待提取列表出错: {str(e)}")
+                        items_error = e
+                        item = None
+                    if item is None:
+                        exhausted = True
+                        break
+                    submitted += 1
+                    future = executor.submit(self._extract_one, item, submitted, total, users, pending_users, is_running, on_user)
+                    futures[future] = item
+
+                if not futures:
+                    break
+
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item = futures.pop(future)
+                    note, skipped = future.result()
+                    if skipped:
+                        continue
+
+                    done += 1
+                    if note:
+                        if keep_results:
+                            notes.append(note)
+                        if on_note:
+                            on_note(note)
+                    else:
+                        self.logger.error(f"笔记 {item} 提取失败")
+                        if on_failed:
+                            on_failed(item)
 
-# 飞书认证
+                    # 更新进度
+                    if on_progress:
+                        on_progress(done, total or submitted)
+
+        if items_error is not None:
+            raise items_error
+        return notes, users
+
+    def _extract_one(self, item, index, total, users, pending_users, is_running, on_user=None):
+        """工作线程：提取一个笔记及其作者信息，返回 (note, skipped)"""
+        if not is_running():
+            return None, True
+
+        try:
+            self.logger.info(f"提取第 {index}/{total or '?'} 个笔记: {item}")
+            note = self.extractor.extract_note(item)
+            if not note:
+                return None, False
+
+            # 提取用户信息，同一用户只请求一次
+            user_id = note.user_id
+            if user_id:
+                with self.lock:
+                    fetch_user = user_id not in users and user_id not in pending_users
+                    if fetch_user:
+                        pending_users.add(user_id)
+
+                if fetch_user:
+                    user = self.extractor.extract_user(user_id)
+                    with self.lock:
+                        pending_users.discard(user_id)
+                        if user:
+                            users[user_id] = user
+                    if user and on_user:
+                        on_user(user)
+
+            return note, False
+
+        except Exception as e:
+            self.logger.error(f"提取笔记出错: {str(e)}")
+            return None, False
+
+def load_fernet():
+    """cryptography 是可选依赖，未安装时返回None（token不缓存到磁盘）"""
+    try:
+        from cryptography.fernet import Fernet
+        return Fernet
+    except ImportError:
+        return None
+
+# 飞书认证（按应用共享，通过 get_feishu_auth 获取）
 class SimpleFeishuAuth:
-    def __init__(self, app_id, app_secret, logger=None):
+    # token到期前 REFRESH_MARGIN 秒视为过期；后台在到期前 RENEW_MARGIN 秒续期，调用方不必等待
+    REFRESH_MARGIN = 300
+    RENEW_MARGIN = 600
+    
+    def __init__(self, app_id, app_secret, logger=None, session=None, cache_dir=CACHE_DIR):
         self.app_id = app_id
         self.app_secret = app_secret
         self.logger = logger or SimpleLogger()
+        self.session = session or create_session(pool_sizes={"https://open.feishu.cn": 8})
         self.token = None
         self.token_expire_time = 0
+        # 同一时刻只有一个线程刷新token
+        self.lock = threading.Lock()
+        self.renew_timer = None
+        # 加密的token缓存，进程重启后继续使用未过期的token
+        self.cache_path = os.path.join(cache_dir, f"feishu_token_{hashlib.sha256(app_id.encode('utf-8')).hexdigest()[:16]}.bin")
+        self.cache_loaded = False
         
     def get_tenant_access_token(self):
-        """获取tenant_access_token"""
-        # 如果token未过期，直接返回
-        current_time = int(time.time())
-        if self.token and current_time < self.token_expire_time - 300:  # 提前5分钟刷新
-            return self.token
+        """获取tenant_access_token，多个线程同时需要刷新时只请求一次"""
+        token = self.valid_token()
+        if token:
+            return token
         
+        with self.lock:
+            # 等锁期间其他线程可能已经刷新
+            token = self.valid_token()
+            if token:
+                return token
+            
+            if not self.cache_loaded:
+                self.cache_loaded = True
+                if self.load_cached_token():
+                    return self.token
+            
+            return self.refresh_token()
+    
+    def valid_token(self):
+        """返回未进入刷新窗口的token，否则返回None"""
+        token = self.token
+        if token and time.time() < self.token_expire_time - self.REFRESH_MARGIN:
+            return token
+        return None
+    
+    def refresh_token(self):
+        """请求新的tenant_access_token（调用方持有 self.lock）"""
         self.logger.info("获取新的tenant_access_token")
         
         try:
@@ -468,7 +2025,8 @@ class SimpleFeishuAuth:
             }
             
             # 发送请求
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            current_time = int(time.time())
+            response = self.session.post(url, headers=headers, json=data, timeout=30)
             
             if response.status_code != 200:
                 self.logger.error(f"获取tenant_access_token失败: {response.status_code} {response.reason}")
@@ -481,53 +2039,498 @@ class SimpleFeishuAuth:
                 return None
             
             # 保存token
+            expire = result.get("expire", 7200)
             self.token = result.get("tenant_access_token")
-            self.token_expire_time = current_time + result.get("expire", 7200)
+            self.token_expire_time = current_time + expire
+            self.save_cached_token()
+            self.schedule_renewal(expire)
             
-            self.logger.info(f"成功获取tenant_access_token，有效期: {result.get('expire')}秒")
+            self.logger.info(f"成功获取tenant_access_token，有效期: {expire}秒")
             return self.token
             
         except Exception as e:
             self.logger.error(f"获取tenant_access_token出错: {str(e)}")
             return None
+    
+    def schedule_renewal(self, expire):
+        """安排在token进入刷新窗口前后台续期"""
+        delay = expire - self.RENEW_MARGIN
+        if delay <= 0:
+            return
+        if self.renew_timer:
+            self.renew_timer.cancel()
+        self.renew_timer = threading.Timer(delay, self.renew)
+        self.renew_timer.daemon = True
+        self.renew_timer.start()
+    
+    def renew(self):
+        """后台续期，失败时由下一次调用同步刷新"""
+        with self.lock:
+            if self.token and time.time() < self.token_expire_time - self.RENEW_MARGIN:
+                return
+            self.logger.info("后台续期tenant_access_token")
+            self.refresh_token()
+    
+    def token_fernet(self):
+        """用 app_id 和 app_secret 派生缓存密钥，未安装cryptography时返回None"""
+        Fernet = load_fernet()
+        if not Fernet:
+            return None
+        key = hashlib.sha256(f"{self.app_id}:{self.app_secret}".encode("utf-8")).digest()
+        return Fernet(base64.urlsafe_b64encode(key))
+    
+    def load_cached_token(self):
+        """读取磁盘上未过期的token，成功返回True"""
+        fernet = self.token_fernet()
+        if not fernet or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, "rb") as f:
+                entry = json.loads(fernet.decrypt(f.read()))
+        except Exception:
+            # app_secret变化或文件损坏时无法解密，重新获取即可
+            return False
+        
+        token = entry.get("token")
+        expire_time = entry.get("expire_time", 0)
+        if not token or time.time() >= expire_time - self.REFRESH_MARGIN:
+            return False
+        
+        self.token = token
+        self.token_expire_time = expire_time
+        self.schedule_renewal(expire_time - time.time())
+        self.logger.info(f"使用缓存的tenant_access_token，剩余有效期: {int(expire_time - time.time())}秒")
+        return True
+    
+    def save_cached_token(self):
+        """加密保存token，未安装cryptography时不保存"""
+        fernet = self.token_fernet()
+        if not fernet:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            data = json.dumps({"token": self.token, "expire_time": self.token_expire_time}).encode("utf-8")
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(fernet.encrypt(data))
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            self.logger.error(f"保存token缓存失败: {str(e)}")
+    
+    def invalidate(self, token=None):
+        """作废当前token，下次获取时重新请求；token已被刷新过则忽略"""
+        with self.lock:
+            if token is None or token == self.token:
+                self.token = None
+                self.token_expire_time = 0
+                # 磁盘上的同一个token也已失效
+                self.cache_loaded = True
+                try:
+                    if os.path.exists(self.cache_path):
+                        os.remove(self.cache_path)
+                except OSError:
+                    pass
+
+# 按应用共享的认证，同一应用的所有上传任务和配置测试共用一个token
+FEISHU_AUTHS = {}
+FEISHU_AUTHS_LOCK = threading.Lock()
+
+def get_feishu_auth(app_id, app_secret, logger=None):
+    """返回应用共享的认证对象，app_secret 变化时重新创建"""
+    with FEISHU_AUTHS_LOCK:
+        auth = FEISHU_AUTHS.get(app_id)
+        if auth is None or auth.app_secret != app_secret:
+            auth = SimpleFeishuAuth(app_id, app_secret, logger=logger)
+            FEISHU_AUTHS[app_id] = auth
+        elif logger:
+            auth.logger = logger
+        return auth
+
+# 飞书多维表格接口限制：批量写入单次最多500条记录，请求体不超过10MB（留出余量）
+BITABLE_MAX_BATCH_RECORDS = 500
+BITABLE_MAX_PAYLOAD_BYTES = 9 * 1024 * 1024
+# 多维表格接口的单应用频率上限（次/秒）
+BITABLE_APP_QPS = 50
+
+# 按应用共享的请求限速器，同一应用的所有表格客户端共用
+FEISHU_APP_LIMITERS = {}
+FEISHU_APP_LIMITERS_LOCK = threading.Lock()
+
+def get_feishu_app_limiter(app_id):
+    """返回应用共享的令牌桶限速器"""
+    with FEISHU_APP_LIMITERS_LOCK:
+        limiter = FEISHU_APP_LIMITERS.get(app_id)
+        if limiter is None:
+            limiter = SimpleTokenBucket(BITABLE_APP_QPS)
+            FEISHU_APP_LIMITERS[app_id] = limiter
+        return limiter
+
+def pack_record_batches(payloads, max_records=BITABLE_MAX_BATCH_RECORDS, max_bytes=BITABLE_MAX_PAYLOAD_BYTES):
+    """按记录数和请求体大小把记录装成尽量大的批次"""
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for payload in payloads:
+        # 与requests发送的JSON编码一致（ensure_ascii），加1为分隔逗号
+        size = len(json.dumps(payload)) + 1
+        if batch and (len(batch) >= max_records or batch_bytes + size > max_bytes):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(payload)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+# 飞书错误码分类
+# 频率限制
+FEISHU_RATE_LIMIT_CODES = (99991400, 1254290)
+# 可重试：写冲突、数据未就绪、服务端超时或内部错误
+FEISHU_RETRYABLE_CODES = (1254291, 1254607, 1255040, 1254036)
+# token无效或过期
+FEISHU_TOKEN_INVALID_CODES = (99991661, 99991663, 99991668)
+# 字段ID或字段名不存在（表格字段被删除或改名）
+FEISHU_FIELD_ERROR_CODES = (1254044, 1254045)
+# 附件字段转换失败（file_token无效、已过期或不属于该多维表格）
+FEISHU_ATTACHMENT_ERROR_CODES = (1254069,)
+
+def classify_feishu_response(response):
+    """飞书响应分类，返回 (类型, 响应JSON, 错误信息, 建议等待秒数)
+
+    类型为 ok / rate_limited / token_invalid / retryable / fatal。
+    """
+    try:
+        result = response.json()
+    except ValueError:
+        result = None
+    code = result.get("code") if isinstance(result, dict) else None
+    message = f"{response.status_code} {result.get('msg') if isinstance(result, dict) else response.reason}"
+    
+    if response.status_code == 429 or code in FEISHU_RATE_LIMIT_CODES:
+        # 飞书网关在限流时返回重置时间（秒）
+        retry_after = None
+        for header in ("x-ogw-ratelimit-reset", "Retry-After"):
+            try:
+                retry_after = float(response.headers[header])
+                break
+            except (KeyError, TypeError, ValueError):
+                continue
+        return "rate_limited", result, message, retry_after
+    if code in FEISHU_TOKEN_INVALID_CODES:
+        return "token_invalid", result, message, None
+    if response.status_code == 200 and code == 0:
+        return "ok", result, message, None
+    if response.status_code >= 500 or code in FEISHU_RETRYABLE_CODES:
+        return "retryable", result, message, None
+    return "fatal", result, message, None
+
+# 熔断器：连续失败或被限流时暂停同一应用的所有请求
+class SimpleCircuitBreaker:
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        """熔断打开期间阻塞调用方"""
+        while True:
+            with self.lock:
+                delay = self.open_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+    
+    def open(self, seconds):
+        """打开熔断器seconds秒"""
+        with self.lock:
+            self.open_until = max(self.open_until, time.monotonic() + seconds)
+    
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+    
+    def record_failure(self):
+        """记录一次失败，连续失败达到阈值时打开熔断器"""
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold:
+                return
+            self.failures = 0
+        self.open(self.cooldown)
+
+FEISHU_CIRCUIT_BREAKERS = {}
+
+def get_feishu_circuit_breaker(app_id):
+    """返回应用共享的熔断器"""
+    with FEISHU_APP_LIMITERS_LOCK:
+        breaker = FEISHU_CIRCUIT_BREAKERS.get(app_id)
+        if breaker is None:
+            breaker = SimpleCircuitBreaker()
+            FEISHU_CIRCUIT_BREAKERS[app_id] = breaker
+        return breaker
+
+# 小红书笔记表的字段（字段名, 字段类型），第一个字段为索引列
+XHS_TABLE_FIELDS = (
+    ("笔记ID", "文本"),
+    ("标题", "文本"),
+    ("内容", "多行文本"),
+    ("用户ID", "文本"),
+    ("用户名", "文本"),
+    ("IP归属地", "文本"),
+    ("笔记类型", "文本"),
+    ("笔记链接", "文本"),
+    ("点赞数", "数字"),
+    ("收藏数", "数字"),
+    ("评论数", "数字"),
+    ("分享数", "数字"),
+    ("粉丝数", "数字"),
+    ("发布时间", "日期时间"),
+    ("标签", "多行文本"),
+    ("图片", "附件")
+)
+
+# 创建数据表接口中的字段类型编号（多维表格的文本字段本身支持多行）
+BITABLE_FIELD_TYPES = {"文本": 1, "数字": 2, "多行文本": 1, "日期时间": 5, "附件": 17}
+
+# 增量同步时比较的字段（会随时间变化的字段）
+SYNC_COMPARE_FIELDS = ("标题", "内容", "用户名", "IP归属地", "笔记类型", "点赞数", "收藏数", "评论数", "分享数", "粉丝数", "标签")
+
+# 飞书附件上传缓存
+class SimpleUploadCache:
+    def __init__(self, path=None, ttl_days=30, logger=None):
+        self.path = path or os.path.join(CACHE_DIR, "feishu_upload_cache.json")
+        self.ttl = ttl_days * 86400
+        self.logger = logger or SimpleLogger()
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """加载缓存文件，文件损坏时从空缓存开始"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except Exception as e:
+            self.logger.error(f"读取上传缓存失败，将重新上传: {str(e)}")
+    
+    def save(self):
+        """有变更时写回缓存文件"""
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = dict(self.entries)
+            self.dirty = False
+        try:
+            write_json_atomic(self.path, entries)
+        except Exception as e:
+            self.logger.error(f"保存上传缓存失败: {str(e)}")
+    
+    def get(self, app_token, content_hash):
+        """返回缓存的file_token，不存在、格式无效或已过期时返回None"""
+        key = f"{app_token}:{content_hash}"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            
+            valid = (
+                isinstance(entry, dict)
+                and isinstance(entry.get("file_token"), str)
+                and entry["file_token"]
+                and time.time() - entry.get("uploaded_at", 0) < self.ttl
+            )
+            if not valid:
+                del self.entries[key]
+                self.dirty = True
+                return None
+            return entry["file_token"]
+    
+    def put(self, app_token, content_hash, file_token):
+        """记录上传结果"""
+        with self.lock:
+            self.entries[f"{app_token}:{content_hash}"] = {
+                "file_token": file_token,
+                "uploaded_at": int(time.time())
+            }
+            self.dirty = True
+    
+    def invalidate(self, app_token, content_hash=None):
+        """删除某张图片或整个应用的缓存（如飞书端文件已失效）"""
+        with self.lock:
+            if content_hash:
+                removed = self.entries.pop(f"{app_token}:{content_hash}", None) is not None
+            else:
+                prefix = f"{app_token}:"
+                keys = [key for key in self.entries if key.startswith(prefix)]
+                for key in keys:
+                    del self.entries[key]
+                removed = bool(keys)
+            self.dirty = self.dirty or removed
+    
+    def invalidate_tokens(self, app_token, file_tokens):
+        """删除指向这些file_token的缓存，返回删除的数量"""
+        file_tokens = set(file_tokens)
+        prefix = f"{app_token}:"
+        with self.lock:
+            keys = [
+                key for key, entry in self.entries.items()
+                if key.startswith(prefix) and isinstance(entry, dict) and entry.get("file_token") in file_tokens
+            ]
+            for key in keys:
+                del self.entries[key]
+            self.dirty = self.dirty or bool(keys)
+        return len(keys)
+
+# 飞书表格字段缓存：按 (app_token, table_id) 保存字段映射，上传到已有表格时不必每次获取字段列表
+class SimpleSchemaCache:
+    def __init__(self, path=None, ttl_days=7, logger=None):
+        self.path = path or os.path.join(CACHE_DIR, "feishu_schema_cache.json")
+        self.ttl = ttl_days * 86400
+        self.logger = logger or SimpleLogger()
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """加载缓存文件，文件损坏时从空缓存开始"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except Exception as e:
+            self.logger.error(f"读取字段缓存失败，将重新获取: {str(e)}")
+    
+    def save(self):
+        """有变更时写回缓存文件"""
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = dict(self.entries)
+            self.dirty = False
+        try:
+            write_json_atomic(self.path, entries)
+        except Exception as e:
+            self.logger.error(f"保存字段缓存失败: {str(e)}")
+    
+    def get(self, app_token, table_id):
+        """返回缓存的 {字段名: field_id}，不存在或已过期时返回None"""
+        with self.lock:
+            entry = self.entries.get(f"{app_token}:{table_id}")
+            if not isinstance(entry, dict) or not isinstance(entry.get("field_map"), dict):
+                return None
+            if time.time() - entry.get("saved_at", 0) >= self.ttl:
+                return None
+            return dict(entry["field_map"])
+    
+    def put(self, app_token, table_id, field_map):
+        with self.lock:
+            self.entries[f"{app_token}:{table_id}"] = {"field_map": dict(field_map), "saved_at": int(time.time())}
+            self.dirty = True
+    
+    def invalidate(self, app_token, table_id):
+        """删除某个数据表的字段映射（如字段被改名或删除导致写入失败）"""
+        with self.lock:
+            removed = self.entries.pop(f"{app_token}:{table_id}", None) is not None
+            self.dirty = self.dirty or removed
 
 # 飞书多维表格
 class SimpleFeishuBitable:
-    def __init__(self, auth, logger=None):
+    def __init__(self, auth, logger=None, session=None, rate_limiter=None, circuit_breaker=None, schema_cache=None):
         self.auth = auth
         self.logger = logger or SimpleLogger()
+        # 默认与认证共用会话，复用到open.feishu.cn的长连接
+        self.session = session or auth.session
+        self.rate_limiter = rate_limiter or get_feishu_app_limiter(auth.app_id)
+        self.circuit_breaker = circuit_breaker or get_feishu_circuit_breaker(auth.app_id)
+        # 重试后仍写入失败的记录，由调用方决定如何处理
+        self.failed_records = []
+        # 写入成功的 (请求中的记录, record_id)
+        self.written_records = []
+        self.schema_cache = schema_cache
+        # upload_images 使用的上传缓存，写入被拒绝时作废其中的附件
+        self.upload_cache = None
+        # 每个线程最近一次失败请求的飞书错误码
+        self.last_error = threading.local()
+    
+    def request(self, method, url, action, max_retries=4, timeout=30, **kwargs):
+        """发送飞书接口请求，成功返回响应JSON，失败返回None
+
+        限流和可重试错误按退避重试，限流优先使用响应头给出的重置时间并打开熔断器，
+        让同一应用的其他调用一起暂停；token失效时刷新后重试；其他错误不重试。
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        if "json" in kwargs:
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        self.last_error.code = None
         
-    def create_app(self, name):
-        """创建多维表格应用"""
-        self.logger.info(f"创建多维表格应用: {name}")
-        
-        try:
+        for attempt in range(max_retries + 1):
+            self.circuit_breaker.wait()
+            
             # 获取token
             token = self.auth.get_tenant_access_token()
             if not token:
                 return None
+            headers["Authorization"] = f"Bearer {token}"
+            
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+                kind, result, message, retry_after = classify_feishu_response(response)
+            except Exception as e:
+                # 连接错误、超时等按可重试处理
+                kind, result, message, retry_after = "retryable", None, str(e), None
+            
+            if kind == "ok":
+                self.circuit_breaker.record_success()
+                return result
+            
+            if kind == "fatal" or attempt >= max_retries:
+                self.logger.error(f"{action}失败: {message}")
+                self.last_error.code = result.get("code") if isinstance(result, dict) else None
+                return None
+            
+            if kind == "token_invalid":
+                self.logger.warning(f"{action}时token失效，刷新后重试")
+                self.auth.invalidate(token)
+                continue
             
+            delay = retry_after or min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+            if kind == "rate_limited":
+                self.logger.warning(f"{action}被限流（{message}），所有请求暂停 {delay:.1f} 秒")
+                self.circuit_breaker.open(delay)
+            else:
+                self.logger.warning(f"{action}失败（{message}），{delay:.1f} 秒后重试")
+                self.circuit_breaker.record_failure()
+                time.sleep(delay)
+        
+        return None
+    
+    def create_app(self, name):
+        """创建多维表格应用"""
+        self.logger.info(f"创建多维表格应用: {name}")
+        
+        try:
             # 构建请求
             url = "https://open.feishu.cn/open-apis/bitable/v1/apps"
-            headers = {
-                "Content-Type": "application/json; charset=utf-8",
-                "Authorization": f"Bearer {token}"
-            }
             data = {
                 "name": name
             }
             
             # 发送请求
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            
-            if response.status_code != 200:
-                self.logger.error(f"创建多维表格应用失败: {response.status_code} {response.reason}")
-                return None
-            
-            # 解析响应
-            result = response.json()
-            if result.get("code") != 0:
-                self.logger.error(f"创建多维表格应用失败: {result.get('msg')}")
+            result = self.request("POST", url, "创建多维表格应用", json=data)
+            if result is None:
                 return None
             
             # 获取app_token
@@ -545,17 +2548,8 @@ class SimpleFeishuBitable:
         self.logger.info(f"创建数据表: {name}")
         
         try:
-            # 获取token
-            token = self.auth.get_tenant_access_token()
-            if not token:
-                return None
-            
             # 构建请求
             url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables"
-            headers = {
-                "Content-Type": "application/json; charset=utf-8",
-                "Authorization": f"Bearer {token}"
-            }
             data = {
                 "table": {
                     "name": name
@@ -563,16 +2557,8 @@ class SimpleFeishuBitable:
             }
             
             # 发送请求
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            
-            if response.status_code != 200:
-                self.logger.error(f"创建数据表失败: {response.status_code} {response.reason}")
-                return None
-            
-            # 解析响应
-            result = response.json()
-            if result.get("code") != 0:
-                self.logger.error(f"创建数据表失败: {result.get('msg')}")
+            result = self.request("POST", url, "创建数据表", json=data)
+            if result is None:
                 return None
             
             # 获取table_id
@@ -585,22 +2571,57 @@ class SimpleFeishuBitable:
             self.logger.error(f"创建数据表出错: {str(e)}")
             return None
     
+    def create_table_with_fields(self, app_token, name, fields):
+        """一次请求创建数据表及全部字段，返回 {"table_id", "field_map"}，失败返回None"""
+        self.logger.info(f"创建数据表及 {len(fields)} 个字段: {name}")
+        
+        try:
+            # 构建请求
+            url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables"
+            data = {
+                "table": {
+                    "name": name,
+                    "fields": [
+                        {"field_name": field_name, "type": BITABLE_FIELD_TYPES.get(field_type, 1)}
+                        for field_name, field_type in fields
+                    ]
+                }
+            }
+            
+            # 发送请求
+            result = self.request("POST", url, "创建数据表", json=data)
+            if result is None:
+                return None
+            
+            result_data = result.get("data", {})
+            table_id = result_data.get("table_id")
+            if not table_id:
+                return None
+            
+            # field_id_list 与请求中的字段顺序一致，没有返回时再获取字段列表
+            field_ids = result_data.get("field_id_list") or []
+            if len(field_ids) == len(fields):
+                field_map = {field_name: field_id for (field_name, _), field_id in zip(fields, field_ids)}
+            else:
+                field_map = self.get_field_map(app_token, table_id, use_cache=False) or {}
+            
+            self.logger.info(f"成功创建数据表，table_id: {table_id}")
+            return {
+                "table_id": table_id,
+                "field_map": field_map
+            }
+            
+        except Exception as e:
+            self.logger.error(f"创建数据表出错: {str(e)}")
+            return None
+    
     def create_field(self, app_token, table_id, field_name, field_type):
         """创建字段"""
         self.logger.info(f"创建字段: {field_name} ({field_type})")
         
         try:
-            # 获取token
-            token = self.auth.get_tenant_access_token()
-            if not token:
-                return None
-            
             # 构建请求
             url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/fields"
-            headers = {
-                "Content-Type": "application/json; charset=utf-8",
-                "Authorization": f"Bearer {token}"
-            }
             
             # 根据字段类型设置不同的字段属性
             field_data = {
@@ -626,16 +2647,8 @@ class SimpleFeishuBitable:
             }
             
             # 发送请求
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            
-            if response.status_code != 200:
-                self.logger.error(f"创建字段失败: {response.status_code} {response.reason}")
-                return None
-            
-            # 解析响应
-            result = response.json()
-            if result.get("code") != 0:
-                self.logger.error(f"创建字段失败: {result.get('msg')}")
+            result = self.request("POST", url, "创建字段", json=data)
+            if result is None:
                 return None
             
             # 获取field_id
@@ -648,37 +2661,32 @@ class SimpleFeishuBitable:
             self.logger.error(f"创建字段出错: {str(e)}")
             return None
     
-    def list_fields(self, app_token, table_id):
-        """获取字段列表"""
+    def list_fields(self, app_token, table_id, page_size=100):
+        """分页获取字段列表"""
         self.logger.info(f"获取字段列表")
         
         try:
-            # 获取token
-            token = self.auth.get_tenant_access_token()
-            if not token:
-                return None
-            
             # 构建请求
             url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/fields"
-            headers = {
-                "Authorization": f"Bearer {token}"
-            }
-            
-            # 发送请求
-            response = requests.get(url, headers=headers, timeout=30)
             
-            if response.status_code != 200:
-                self.logger.error(f"获取字段列表失败: {response.status_code} {response.reason}")
-                return None
-            
-            # 解析响应
-            result = response.json()
-            if result.get("code") != 0:
-                self.logger.error(f"获取字段列表失败: {result.get('msg')}")
-                return None
-            
-            # 获取字段列表
-            fields = result.get("data", {}).get("items", [])
+            fields = []
+            page_token = None
+            while True:
+                params = {"page_size": page_size}
+                if page_token:
+                    params["page_token"] = page_token
+                
+                # 发送请求
+                result = self.request("GET", url, "获取字段列表", params=params)
+                if result is None:
+                    return None
+                
+                data = result.get("data", {})
+                fields.extend(data.get("items") or [])
+                
+                page_token = data.get("page_token")
+                if not data.get("has_more") or not page_token:
+                    break
             
             self.logger.info(f"成功获取字段列表，共 {len(fields)} 个字段")
             return fields
@@ -687,47 +2695,61 @@ class SimpleFeishuBitable:
             self.logger.error(f"获取字段列表出错: {str(e)}")
             return None
     
+    def get_field_map(self, app_token, table_id, use_cache=True):
+        """返回 {字段名: field_id}，优先使用字段缓存，未命中时获取字段列表并写入缓存"""
+        if use_cache and self.schema_cache:
+            field_map = self.schema_cache.get(app_token, table_id)
+            if field_map:
+                self.logger.info(f"使用缓存的字段映射，共 {len(field_map)} 个字段")
+                return field_map
+        
+        fields = self.list_fields(app_token, table_id)
+        if not fields:
+            return None
+        
+        field_map = {}
+        for field in fields:
+            field_name = field.get("field_name")
+            field_id = field.get("field_id")
+            if field_name and field_id:
+                field_map[field_name] = field_id
+        
+        if self.schema_cache:
+            self.schema_cache.put(app_token, table_id, field_map)
+            self.schema_cache.save()
+        return field_map
+    
     def setup_xiaohongshu_table(self, app_token):
         """设置小红书笔记表格"""
         self.logger.info("设置小红书笔记表格")
         
         try:
-            # 创建数据表
-            table_id = self.create_table(app_token, "小红书笔记")
-            if not table_id:
-                return None
-            
-            # 创建字段
-            fields = [
-                ("笔记ID", "文本"),
-                ("标题", "文本"),
-                ("内容", "多行文本"),
-                ("用户ID", "文本"),
-                ("用户名", "文本"),
-                ("IP归属地", "文本"),
-                ("笔记类型", "文本"),
-                ("笔记链接", "文本"),
-                ("点赞数", "数字"),
-                ("收藏数", "数字"),
-                ("评论数", "数字"),
-                ("分享数", "数字"),
-                ("粉丝数", "数字"),
-                ("发布时间", "日期时间"),
-                ("标签", "多行文本"),
-                ("图片", "附件")
-            ]
+            # 一次请求创建数据表和全部字段
+            table_info = self.create_table_with_fields(app_token, "小红书笔记", XHS_TABLE_FIELDS)
+            
+            if not table_info:
+                # 接口不接受字段定义时退回到逐个创建字段
+                self.logger.warning("一次创建数据表和字段失败，改为逐个创建字段")
+                table_id = self.create_table(app_token, "小红书笔记")
+                if not table_id:
+                    return None
+                
+                field_map = {}
+                for field_name, field_type in XHS_TABLE_FIELDS:
+                    field_id = self.create_field(app_token, table_id, field_name, field_type)
+                    if field_id:
+                        field_map[field_name] = field_id
+                table_info = {
+                    "table_id": table_id,
+                    "field_map": field_map
+                }
             
-            field_map = {}
-            for field_name, field_type in fields:
-                field_id = self.create_field(app_token, table_id, field_name, field_type)
-                if field_id:
-                    field_map[field_name] = field_id
+            if self.schema_cache and table_info["field_map"]:
+                self.schema_cache.put(app_token, table_info["table_id"], table_info["field_map"])
+                self.schema_cache.save()
             
-            self.logger.info(f"成功设置小红书笔记表格，创建了 {len(field_map)} 个字段")
-            return {
-                "table_id": table_id,
-                "field_map": field_map
-            }
+            self.logger.info(f"成功设置小红书笔记表格，创建了 {len(table_info['field_map'])} 个字段")
+            return table_info
             
         except Exception as e:
             self.logger.error(f"设置小红书笔记表格出错: {str(e)}")
@@ -738,11 +2760,6 @@ class SimpleFeishuBitable:
         self.logger.info(f"上传图片: {image_path}")
         
         try:
-            # 获取token
-            token = self.auth.get_tenant_access_token()
-            if not token:
-                return None
-            
             # 检查文件是否存在
             if not os.path.exists(image_path):
                 self.logger.error(f"图片文件不存在: {image_path}")
@@ -750,27 +2767,16 @@ class SimpleFeishuBitable:
             
             # 构建请求
             url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/fields/{field_id}/attachments"
-            headers = {
-                "Authorization": f"Bearer {token}"
-            }
             
-            # 读取文件
+            # 读取文件（读入内存，重试时可以重新发送）
             with open(image_path, "rb") as f:
                 files = {
-                    "file": (os.path.basename(image_path), f, "image/jpeg")
+                    "file": (os.path.basename(image_path), f.read(), mimetypes.guess_type(image_path)[0] or "image/jpeg")
                 }
-                
-                # 发送请求
-                response = requests.post(url, headers=headers, files=files, timeout=60)
-            
-            if response.status_code != 200:
-                self.logger.error(f"上传图片失败: {response.status_code} {response.reason}")
-                return None
             
-            # 解析响应
-            result = response.json()
-            if result.get("code") != 0:
-                self.logger.error(f"上传图片失败: {result.get('msg')}")
+            # 发送请求
+            result = self.request("POST", url, "上传图片", files=files, timeout=60)
+            if result is None:
                 return None
             
             # 获取file_token
@@ -783,49 +2789,97 @@ class SimpleFeishuBitable:
             self.logger.error(f"上传图片出错: {str(e)}")
             return None
     
+    def upload_images(self, app_token, table_id, field_id, image_paths, cache=None, max_workers=4):
+        """批量上传图片，返回 {图片路径: file_token}
+
+        按内容哈希去重：命中缓存的不再上传，同一次调用中内容相同的图片只上传一次，
+        其余图片并行上传。
+        """
+        hashes = {}
+        for image_path in image_paths:
+            if image_path not in hashes and os.path.exists(image_path):
+                hashes[image_path] = file_sha256(image_path)
+        
+        tokens = {}
+        missing = {}
+        for image_path, content_hash in hashes.items():
+            file_token = cache.get(app_token, content_hash) if cache else None
+            if file_token:
+                tokens[image_path] = file_token
+            else:
+                missing.setdefault(content_hash, image_path)
+        
+        if cache:
+            self.upload_cache = cache
+        
+        uploaded = {}
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+                futures = {
+                    executor.submit(self.upload_image, app_token, table_id, field_id, image_path): content_hash
+                    for content_hash, image_path in missing.items()
+                }
+                for future in as_completed(futures):
+                    content_hash = futures[future]
+                    file_token = future.result()
+                    if file_token:
+                        uploaded[content_hash] = file_token
+                        if cache:
+                            cache.put(app_token, content_hash, file_token)
+        
+        for image_path, content_hash in hashes.items():
+            if image_path not in tokens and content_hash in uploaded:
+                tokens[image_path] = uploaded[content_hash]
+        
+        if cache:
+            cache.save()
+        
+        self.logger.info(f"图片上传完成: 共 {len(hashes)} 张，命中缓存 {len(hashes) - len(missing)} 张，新上传 {len(uploaded)}/{len(missing)} 张")
+        return tokens
+    
     def convert_xiaohongshu_note_to_record(self, note, user, field_map, image_paths=None):
         """将小红书笔记转换为飞书记录"""
         try:
             record = {}
             
             # 添加笔记信息
-            if "笔记ID" in field_map and hasattr(note, "note_id"):
+            if "笔记ID" in field_map:
                 record[field_map["笔记ID"]] = note.note_id
             
-            if "标题" in field_map and hasattr(note, "title"):
+            if "标题" in field_map:
                 record[field_map["标题"]] = note.title
             
-            if "内容" in field_map and hasattr(note, "desc"):
+            if "内容" in field_map:
                 record[field_map["内容"]] = note.desc
             
-            if "用户ID" in field_map and hasattr(note, "user_id"):
+            if "用户ID" in field_map:
                 record[field_map["用户ID"]] = note.user_id
             
-            if "用户名" in field_map and hasattr(note, "nickname"):
+            if "用户名" in field_map:
                 record[field_map["用户名"]] = note.nickname
             
-            if "IP归属地" in field_map and hasattr(note, "ip_location"):
+            if "IP归属地" in field_map:
                 record[field_map["IP归属地"]] = note.ip_location
             
-            if "笔记类型" in field_map and hasattr(note, "note_type"):
+            if "笔记类型" in field_map:
                 record[field_map["笔记类型"]] = note.note_type
             
-            if "笔记链接" in field_map and hasattr(note, "note_id"):
+            if "笔记链接" in field_map:
                 record[field_map["笔记链接"]] = f"https://www.xiaohongshu.com/explore/{note.note_id}"
             
-            if "点赞数" in field_map and hasattr(note, "liked_count"):
+            if "点赞数" in field_map:
                 record[field_map["点赞数"]] = note.liked_count
             
-            if "收藏数" in field_map and hasattr(note, "collected_count"):
+            if "收藏数" in field_map:
                 record[field_map["收藏数"]] = note.collected_count
             
-            if "评论数" in field_map and hasattr(note, "comment_count"):
+            if "评论数" in field_map:
                 record[field_map["评论数"]] = note.comment_count
             
-            if "分享数" in field_map and hasattr(note, "share_count"):
+            if "分享数" in field_map:
                 record[field_map["分享数"]] = note.share_count
             
-            if "发布时间" in field_map and hasattr(note, "upload_time") and note.upload_time:
+            if "发布时间" in field_map and note.upload_time:
                 # 转换时间格式
                 if isinstance(note.upload_time, int):
                     # 毫秒时间戳转ISO格式
@@ -834,12 +2888,12 @@ class SimpleFeishuBitable:
                 else:
                     record[field_map["发布时间"]] = note.upload_time
             
-            if "标签" in field_map and hasattr(note, "tag_list") and note.tag_list:
+            if "标签" in field_map and note.tag_list:
                 record[field_map["标签"]] = ", ".join(note.tag_list)
             
             # 添加用户信息
             if user:
-                if "粉丝数" in field_map and hasattr(user, "fans"):
+                if "粉丝数" in field_map:
                     record[field_map["粉丝数"]] = user.fans
             
             # 添加图片路径（用于后续上传）
@@ -855,59 +2909,953 @@ class SimpleFeishuBitable:
     def batch_create_records(self, app_token, table_id, records):
         """批量创建记录"""
         self.logger.info(f"批量创建记录: {len(records)}条")
-        
+        return self.batch_write_records(app_token, table_id, "batch_create", [{"fields": record} for record in records], "创建")
+    
+    def batch_update_records(self, app_token, table_id, records):
+        """批量更新记录，records 为 [{"record_id": ..., "fields": {...}}]"""
+        self.logger.info(f"批量更新记录: {len(records)}条")
+        return self.batch_write_records(app_token, table_id, "batch_update", records, "更新")
+    
+    def batch_write_records(self, app_token, table_id, action, payloads, action_name):
+        """分批调用 records/batch_create 或 records/batch_update，返回成功的record_id列表"""
         try:
-            # 获取token
-            token = self.auth.get_tenant_access_token()
-            if not token:
-                return None
-            
             # 构建请求
-            url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/records/batch_create"
-            headers = {
-                "Content-Type": "application/json; charset=utf-8",
-                "Authorization": f"Bearer {token}"
-            }
+            url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/records/{action}"
             
-            # 分批处理，每次最多10条
-            batch_size = 10
+            # 按接口上限装批，按应用QPS限速
+            batches = pack_record_batches(payloads)
             record_ids = []
+            start_time = time.monotonic()
             
-            for i in range(0, len(records), batch_size):
-                batch_records = records[i:i+batch_size]
-                
+            for batch in batches:
                 data = {
-                    "records": [{"fields": record} for record in batch_records]
+                    "records": batch
                 }
                 
-                # 发送请求
-                response = requests.post(url, headers=headers, json=data, timeout=60)
-                
-                if response.status_code != 200:
-                    self.logger.error(f"批量创建记录失败: {response.status_code} {response.reason}")
-                    continue
+                # 创建记录不是幂等的：每批一个client_token，重试时沿用，已提交的请求不会重复创建
+                params = {"client_token": str(uuid.uuid4())} if action == "batch_create" else None
                 
-                # 解析响应
-                result = response.json()
-                if result.get("code") != 0:
-                    self.logger.error(f"批量创建记录失败: {result.get('msg')}")
+                # 发送请求，重试后仍失败的批次交还调用方
+                result = self.request("POST", url, f"批量{action_name}记录", json=data, params=params, timeout=60)
+                if result is None:
+                    self.failed_records.extend(batch)
+                    # 字段不存在说明缓存的字段映射已过期，下次上传时重新获取
+                    if self.last_error.code in FEISHU_FIELD_ERROR_CODES and self.schema_cache:
+                        self.logger.warning("表格字段已变化，已清除字段缓存，下次上传时重新获取字段列表")
+                        self.schema_cache.invalidate(app_token, table_id)
+                        self.schema_cache.save()
+                    # 附件被拒绝说明缓存的file_token已失效，下次重新上传
+                    if self.last_error.code in FEISHU_ATTACHMENT_ERROR_CODES and self.upload_cache:
+                        self.invalidate_batch_attachments(app_token, batch)
                     continue
                 
                 # 获取record_ids
                 batch_record_ids = [record.get("record_id") for record in result.get("data", {}).get("records", [])]
                 record_ids.extend(batch_record_ids)
+                # 返回的记录与请求中的记录顺序一致
+                self.written_records.extend(zip(batch, batch_record_ids))
                 
-                self.logger.info(f"成功创建 {len(batch_record_ids)} 条记录")
-                
-                # 避免请求过快
-                time.sleep(1)
+                self.logger.info(f"成功{action_name} {len(batch_record_ids)} 条记录")
             
-            self.logger.info(f"批量创建记录完成，共 {len(record_ids)} 条")
+            elapsed = max(time.monotonic() - start_time, 0.001)
+            self.logger.info(f"批量{action_name}记录完成，共 {len(record_ids)} 条，{len(batches)} 个批次，用时 {elapsed:.1f} 秒，{len(record_ids) / elapsed:.1f} 条/秒")
+            if len(record_ids) < len(payloads):
+                self.logger.error(f"有 {len(payloads) - len(record_ids)} 条记录{action_name}失败，已保留在 failed_records 中")
             return record_ids
             
         except Exception as e:
-            self.logger.error(f"批量创建记录出错: {str(e)}")
-            return None
+            self.logger.error(f"批量{action_name}记录出错: {str(e)}")
+            return None
+    
+    def invalidate_batch_attachments(self, app_token, batch):
+        """从上传缓存中删除一批记录引用的file_token"""
+        file_tokens = [
+            item["file_token"]
+            for payload in batch
+            for value in (payload.get("fields") or {}).values() if isinstance(value, list)
+            for item in value if isinstance(item, dict) and item.get("file_token")
+        ]
+        removed = self.upload_cache.invalidate_tokens(app_token, file_tokens) if file_tokens else 0
+        if removed:
+            self.upload_cache.save()
+            self.logger.warning(f"已作废该批记录引用的 {removed} 个附件缓存，下次上传时重新上传图片")
+    
+    def list_records(self, app_token, table_id, page_size=500):
+        """分页获取数据表的全部记录"""
+        self.logger.info("获取已有记录")
+        
+        try:
+            # 构建请求
+            url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/records"
+            
+            items = []
+            page_token = None
+            while True:
+                params = {"page_size": page_size}
+                if page_token:
+                    params["page_token"] = page_token
+                
+                # 发送请求
+                result = self.request("GET", url, "获取已有记录", params=params, timeout=60)
+                if result is None:
+                    return None
+                
+                data = result.get("data", {})
+                items.extend(data.get("items") or [])
+                
+                page_token = data.get("page_token")
+                if not data.get("has_more") or not page_token:
+                    break
+            
+            self.logger.info(f"成功获取已有记录，共 {len(items)} 条")
+            return items
+            
+        except Exception as e:
+            self.logger.error(f"获取已有记录出错: {str(e)}")
+            return None
+    
+    @staticmethod
+    def normalize_field_value(value):
+        """把飞书返回的字段值和本地记录的字段值统一成可比较的字符串"""
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            # 文本字段返回 [{"type": "text", "text": ...}] 片段数组
+            return "".join(item.get("text", "") if isinstance(item, dict) else str(item) for item in value)
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+    
+    def record_fingerprint(self, fields, field_map):
+        """记录可变字段的指纹，fields 以 field_id 为键
+
+        只比较会随时间变化的字段；图片和发布时间不参与比较，
+        前者不会重复上传，后者在飞书中的存储格式与本地不同。
+        """
+        values = [
+            self.normalize_field_value(fields.get(field_map[field_name]))
+            for field_name in SYNC_COMPARE_FIELDS if field_name in field_map
+        ]
+        return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()
+    
+    def load_record_index(self, app_token, table_id, field_map):
+        """加载已有记录索引 {笔记ID: {"record_id": ..., "fingerprint": ...}}"""
+        if "笔记ID" not in field_map:
+            self.logger.error("数据表缺少“笔记ID”字段，无法增量同步")
+            return None
+        
+        items = self.list_records(app_token, table_id)
+        if items is None:
+            return None
+        
+        index = {}
+        for item in items:
+            # 飞书按字段名返回，转换为与本地记录一致的 field_id 键
+            fields = {field_map[name]: value for name, value in (item.get("fields") or {}).items() if name in field_map}
+            note_id = self.normalize_field_value(fields.get(field_map["笔记ID"]))
+            if note_id:
+                index[note_id] = {
+                    "record_id": item.get("record_id"),
+                    "fingerprint": self.record_fingerprint(fields, field_map)
+                }
+        return index
+    
+    def plan_sync(self, index, records, field_map):
+        """对比已有记录，返回 (待创建记录, 待更新记录, 跳过数量)
+
+        待更新记录不包含图片字段，已有记录的附件保持不变。
+        """
+        to_create = []
+        to_update = []
+        skipped = 0
+        
+        for record in records:
+            note_id = self.normalize_field_value(record.get(field_map["笔记ID"]))
+            existing = index.get(note_id)
+            if not existing:
+                to_create.append(record)
+                continue
+            
+            if existing["fingerprint"] == self.record_fingerprint(record, field_map):
+                skipped += 1
+                continue
+            
+            fields = {key: value for key, value in record.items() if not key.startswith("_") and key != field_map.get("图片")}
+            to_update.append({"record_id": existing["record_id"], "fields": fields})
+        
+        return to_create, to_update, skipped
+
+# 飞书上传流水线
+class SimpleFeishuPipeline:
+    """边提取边上传：笔记 → 上传图片附件 → 批量写入记录
+
+    两个阶段各用一个线程，之间是有界队列。下游跟不上时 put 会阻塞提取线程（背压），
+    整体耗时取决于最慢的阶段，而不是各阶段耗时之和。
+    """
+    def __init__(self, bitable, app_token, table_id, field_map, build_record, index=None, image_cache=None, logger=None,
+                 queue_size=100, attach_batch=20, write_batch=BITABLE_MAX_BATCH_RECORDS, flush_interval=5.0, image_workers=4,
+                 on_written=None):
+        self.bitable = bitable
+        self.app_token = app_token
+        self.table_id = table_id
+        self.field_map = field_map
+        self.build_record = build_record
+        # 增量同步时为已有记录索引，否则为None（全部新增）
+        self.index = index
+        self.image_cache = image_cache
+        # 每批写入成功后以笔记ID列表回调（在写入线程中）
+        self.on_written = on_written
+        self.logger = logger or bitable.logger
+        self.attach_batch = max(1, int(attach_batch))
+        self.write_batch = max(1, int(write_batch))
+        self.flush_interval = flush_interval
+        self.image_workers = image_workers
+        
+        self.attach_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = 0
+        
+        self.threads = [
+            threading.Thread(target=self.attach_loop, name="feishu-attach", daemon=True),
+            threading.Thread(target=self.write_loop, name="feishu-write", daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+    
+    def put(self, note):
+        """提交一个笔记，队列已满时阻塞"""
+        self.attach_queue.put(note)
+    
+    def close(self):
+        """等待已提交的笔记全部写入，返回 {created, updated, skipped, errors}"""
+        self.attach_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return {"created": self.created, "updated": self.updated, "skipped": self.skipped, "errors": self.errors}
+    
+    @staticmethod
+    def take_batch(source, size, timeout=None):
+        """等待第一项后再取已排队的项，最多 size 项，返回 (items, 是否收到结束标记)"""
+        items = []
+        try:
+            item = source.get(timeout=timeout)
+        except queue.Empty:
+            return items, False
+        while True:
+            if item is None:
+                return items, True
+            items.append(item)
+            if len(items) >= size:
+                return items, False
+            try:
+                item = source.get_nowait()
+            except queue.Empty:
+                return items, False
+    
+    def attach_loop(self):
+        """阶段一：转换记录、对比已有记录、上传图片附件"""
+        done = False
+        while not done:
+            notes, done = self.take_batch(self.attach_queue, self.attach_batch)
+            if not notes:
+                continue
+            try:
+                self.attach_images(notes)
+            except Exception as e:
+                self.errors += len(notes)
+                self.logger.error(f"处理待上传记录出错: {str(e)}")
+        self.write_queue.put(None)
+    
+    def attach_images(self, notes):
+        """一批笔记的图片一次上传（按内容去重、并行），再交给写入阶段"""
+        records = []
+        for note in notes:
+            record = self.build_record(note)
+            if record:
+                records.append(record)
+            else:
+                self.errors += 1
+        
+        update_records = []
+        if self.index is not None:
+            records, update_records, skipped = self.bitable.plan_sync(self.index, records, self.field_map)
+            self.skipped += skipped
+        
+        if "图片" in self.field_map:
+            all_image_paths = [path for record in records for path in record.get("_image_paths", [])]
+            if all_image_paths:
+                file_tokens = self.bitable.upload_images(
+                    self.app_token, self.table_id, self.field_map["图片"], all_image_paths,
+                    cache=self.image_cache, max_workers=self.image_workers
+                )
+                for record in records:
+                    image_tokens = [{"file_token": file_tokens[path]} for path in record.get("_image_paths", []) if path in file_tokens]
+                    if image_tokens:
+                        record[self.field_map["图片"]] = image_tokens
+        
+        for record in records:
+            record.pop("_image_paths", None)
+            self.write_queue.put(("create", record))
+        for record in update_records:
+            self.write_queue.put(("update", record))
+    
+    def write_loop(self):
+        """阶段二：攒够一批或距第一条等待超过 flush_interval 秒时写入飞书"""
+        pending = {"create": [], "update": []}
+        deadline = None
+        done = False
+        while not done:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            items, done = self.take_batch(self.write_queue, self.write_batch, timeout)
+            for action, record in items:
+                pending[action].append(record)
+            
+            if deadline is None and (pending["create"] or pending["update"]):
+                deadline = time.monotonic() + self.flush_interval
+            full = max(len(pending["create"]), len(pending["update"])) >= self.write_batch
+            if done or full or (deadline is not None and time.monotonic() >= deadline):
+                self.flush(pending["create"], pending["update"])
+                pending = {"create": [], "update": []}
+                deadline = None
+    
+    def flush(self, create_records, update_records):
+        """写入一批记录，失败的记录由 bitable.failed_records 保留"""
+        written_start = len(self.bitable.written_records)
+        try:
+            if create_records:
+                self.created += len(self.bitable.batch_create_records(self.app_token, self.table_id, create_records) or [])
+            if update_records:
+                self.updated += len(self.bitable.batch_update_records(self.app_token, self.table_id, update_records) or [])
+        except Exception as e:
+            self.errors += len(create_records) + len(update_records)
+            self.logger.error(f"写入飞书记录出错: {str(e)}")
+        
+        if self.on_written and "笔记ID" in self.field_map:
+            note_ids = [
+                self.bitable.normalize_field_value((payload.get("fields") or {}).get(self.field_map["笔记ID"]))
+                for payload, _ in self.bitable.written_records[written_start:]
+            ]
+            if note_ids:
+                self.on_written([note_id for note_id in note_ids if note_id])
+
+# 提取任务（不依赖界面，GUI和命令行共用）
+DEFAULT_CONFIG = {
+    "xhs_cookie": "",
+    "feishu_app_id": "",
+    "feishu_app_secret": "",
+    "output_dir": "data/images",
+    "extract_mode": "url",
+    "note_url": "",
+    "keyword": "",
+    "user_id": "",
+    "count": 10,
+    "max_workers": 4,
+    "image_workers": 8,
+    "max_download_kbps": 0,
+    "sort_type": 0,
+    "download_images": True,
+    "upload_to_feishu": False,
+    "create_table": True,
+    "incremental_sync": False,
+    "app_token": "",
+    "table_id": "",
+    "save_to_file": True,
+    "resume": False,
+    "output_file": "results.json",
+    "output_format": "json",
+    "batch_file": "",
+    "log_file": "",
+    "log_json": False,
+    "save_to_db": True,
+    "profile_ttl_hours": 24,
+    "only_new_notes": False
+}
+
+def validate_config(config):
+    """检查运行所需的配置，返回错误信息，没有问题时返回None"""
+    if not config["xhs_cookie"]:
+        return "请输入小红书Cookie"
+    
+    mode = config["extract_mode"]
+    required = {"url": ("note_url", "请输入笔记URL"), "keyword": ("keyword", "请输入关键词"),
+                "user": ("user_id", "请输入用户ID"), "batch": ("batch_file", "请选择URL列表文件")}
+    if mode not in required:
+        return f"未知的提取模式: {mode}"
+    key, message = required[mode]
+    if not config[key]:
+        return message
+    
+    if config["upload_to_feishu"]:
+        if not config["feishu_app_id"] or not config["feishu_app_secret"]:
+            return "请输入飞书App ID和App Secret"
+        if not config["create_table"] and (not config["app_token"] or not config["table_id"]):
+            return "请输入应用Token和表格ID"
+    return None
+
+class SimpleExtractionJob:
+    def __init__(self, config, logger=None, is_running=None, on_progress=None, on_note=None):
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.logger = logger or SimpleLogger()
+        self.is_running = is_running or (lambda: True)
+        self.on_progress = on_progress
+        self.on_note = on_note
+        
+        self.extractor = None
+        self.store = None
+        self.profile_cache = None
+        self.watermarks = None
+        self.journal = None
+        self.note_writer = None
+        self.user_writer = None
+        # 上传飞书时边提取边上传；upload_key 为 "app_token:table_id"，断点日志中按表记录已写入的笔记
+        self.pipeline = None
+        self.upload_key = None
+        # 飞书表格在第一个需要上传的笔记出现时才准备，为True表示尚未准备
+        self.feishu_pending = False
+        self.notes = []
+        self.users = {}
+        # 断点续传恢复的笔记数，位于 notes 的开头
+        self.restored_count = 0
+        # 本次运行提取成功和失败的笔记数（流式输出时 notes 可能不保留笔记）
+        self.note_count = 0
+        self.failed_count = 0
+        # 未上传时为None
+        self.upload_ok = None
+        # 搜索结果或用户笔记列表中途获取失败时为False（已取到的笔记照常提取）
+        self.listing_ok = True
+    
+    def run(self):
+        """运行提取和上传，出现致命错误时返回False"""
+        ok = True
+        try:
+            # 本地数据库
+            if self.config["save_to_db"]:
+                self.store = SimpleNoteStore(logger=self.logger)
+            
+            # 用户资料缓存，有效期为0时不使用
+            if self.config["profile_ttl_hours"] > 0:
+                self.profile_cache = SimpleProfileCache(ttl_hours=self.config["profile_ttl_hours"], logger=self.logger)
+            
+            # 用户笔记水位，只提取上次之后发布的笔记
+            if self.config["only_new_notes"]:
+                self.watermarks = SimpleWatermarkCache(logger=self.logger)
+            
+            # 初始化提取器
+            self.extractor = SimpleXHSExtractor(
+                cookie=self.config["xhs_cookie"],
+                output_dir=self.config["output_dir"],
+                logger=self.logger,
+                image_workers=self.config["image_workers"],
+                max_bytes_per_second=self.config["max_download_kbps"] * 1024,
+                note_store=self.store,
+                profile_cache=self.profile_cache,
+                max_workers=self.config["max_workers"]
+            )
+            
+            # 根据模式提取数据
+            mode = self.config["extract_mode"]
+            count = self.config["count"]
+            
+            # 断点日志：每个笔记完成后立即记录，续传时恢复已完成的结果
+            targets = {
+                "url": self.config["note_url"],
+                "keyword": f"{self.config['keyword']}:{self.config['sort_type']}",
+                "user": self.config["user_id"],
+                "batch": os.path.abspath(self.config["batch_file"])
+            }
+            self.journal = SimpleCheckpointJournal(
+                SimpleCheckpointJournal.job_path(mode, targets[mode]),
+                reset=not self.config["resume"],
+                logger=self.logger
+            )
+            if self.config["resume"]:
+                self.notes, self.users = self.journal.restore()
+                self.restored_count = len(self.notes)
+                self.logger.info(f"断点续传: 恢复 {len(self.notes)} 个已完成的笔记，{len(self.users)} 个用户信息")
+            
+            # 流式输出：每提取完一个笔记就写入
+            if self.config["save_to_file"] and self.config["output_format"] != "json":
+                self.open_stream_writers()
+            
+            # 飞书表格在有笔记需要上传时才准备，一个笔记都没有时不创建应用和数据表
+            self.feishu_pending = self.config["upload_to_feishu"]
+            if self.notes:
+                self.ensure_feishu_pipeline()
+            
+            if mode == "url":
+                # 提取单个笔记
+                url = self.config["note_url"]
+                note_id = self.extractor.extract_note_id(url)
+                if note_id and self.journal.is_done("note", note_id):
+                    self.logger.info(f"笔记已提取，跳过: {url}")
+                else:
+                    self.logger.info(f"提取单个笔记: {url}")
+                    note = self.extractor.extract_note(url)
+                    if note:
+                        self.logger.info(f"成功提取笔记: {note.title}")
+                        
+                        # 提取用户信息（先于笔记完成回调，上传的记录中带有粉丝数）
+                        if note.user_id and note.user_id not in self.users:
+                            user = self.extractor.extract_user(note.user_id)
+                            if user:
+                                self.users[note.user_id] = user
+                                self.on_user_done(user)
+                        
+                        self.notes.append(note)
+                        self.on_note_done(note)
+                    else:
+                        self.logger.error("笔记提取失败")
+                        self.on_note_failed(note_id or url)
+                
+            elif mode == "keyword":
+                # 搜索并提取笔记
+                keyword = self.config["keyword"]
+                sort_type = self.config["sort_type"]
+                # 逐页搜索，前面的笔记提取时再请求后面的页
+                paging = {}
+                note_ids = self.extractor.iter_search_notes(keyword, sort_type=sort_type, limit=count or None, state=paging)
+                listed = []
+                self.logger.info(f"开始提取搜索结果，最多 {count} 个笔记" if count else "开始提取全部搜索结果")
+                self.run_concurrent_extraction(self.record_listed(note_ids, listed), total=count or None)
+                if not self.check_listing(paging, listed):
+                    ok = False
+                
+            elif mode == "user":
+                # 提取用户的所有笔记
+                user_id = self.config["user_id"]
+                self.logger.info(f"提取用户笔记: {user_id}")
+                
+                # 提取用户信息
+                user = self.extractor.extract_user(user_id)
+                if user:
+                    self.users[user.user_id] = user
+                    self.on_user_done(user)
+                    
+                    # 逐页获取用户笔记，边翻页边提取
+                    # 有水位时提取上次之后的全部新笔记，不受提取数量限制，否则超出数量的新笔记以后再也取不到
+                    since = self.watermarks.get(user.user_id) if self.watermarks else None
+                    limit = None if since else (count or None)
+                    if since:
+                        self.logger.info(f"只提取 {datetime.datetime.fromtimestamp(since):%Y-%m-%d %H:%M:%S} 之后发布的笔记（不限数量）")
+                    paging = {}
+                    note_ids = self.extractor.iter_user_note_ids(user_id, limit=limit, since=since, state=paging)
+                    listed = []
+                    start_count = self.note_count
+                    self.run_concurrent_extraction(self.record_listed(note_ids, listed), total=limit)
+                    self.logger.info(f"成功提取 {self.note_count - start_count} 个笔记")
+                    
+                    # 水位只在翻到上次的位置或翻完全部笔记后前进（首次运行时以本次最新的笔记为起点），
+                    # 且要求全部成功、未中断；获取失败或翻页未完成时保留原水位
+                    reached = paging.get("stopped") in ("since", "exhausted") or (not since and paging.get("stopped") == "limit")
+                    if self.watermarks and listed and reached and not self.failed_count and self.is_running():
+                        newest = max(note_id_timestamp(note_id) for note_id in listed)
+                        if newest:
+                            self.watermarks.put(user.user_id, newest)
+                    elif self.watermarks and listed:
+                        self.logger.warning("用户笔记未全部获取或有笔记提取失败，不更新水位")
+                    
+                    # 有水位时没有新笔记是正常结果
+                    if not self.check_listing(paging, listed, allow_empty=bool(since) and paging.get("stopped") in ("since", "exhausted")):
+                        ok = False
+                else:
+                    self.logger.error(f"用户 {user_id} 提取失败")
+                    ok = False
+                
+            elif mode == "batch":
+                # 从文件加载URL列表
+                batch_file = self.config["batch_file"]
+                if not os.path.exists(batch_file):
+                    self.logger.error(f"URL列表文件不存在: {batch_file}")
+                    return False
+                
+                with open(batch_file, 'r', encoding='utf-8') as f:
+                    urls = [line.strip() for line in f if line.strip()]
+                
+                # 限制数量
+                if count and count < len(urls):
+                    urls = urls[:count]
+                
+                self.logger.info(f"从文件加载了 {len(urls)} 个URL")
+                self.run_concurrent_extraction(urls)
+            
+            # 保存结果到文件
+            if self.note_writer:
+                self.logger.info(f"流式输出完成: {self.note_writer.count} 个笔记，{self.user_writer.count} 个用户信息")
+            elif self.config["save_to_file"] and self.notes:
+                output_file = self.config["output_file"]
+                self.logger.info(f"保存结果到文件: {output_file}")
+                
+                # 转换为可序列化的格式
+                result = {
+                    "notes": [note.to_dict() for note in self.notes],
+                    "users": {user_id: user.to_dict() for user_id, user in self.users.items()}
+                }
+                
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(result, f, ensure_ascii=False, indent=2)
+                
+                self.logger.info(f"成功保存结果到文件: {output_file}")
+            
+            # 等待飞书上传写完剩余记录
+            if self.pipeline:
+                self.upload_ok = self.finish_feishu_pipeline()
+            elif self.feishu_pending:
+                self.logger.info("没有需要上传的笔记，未准备飞书表格")
+            
+            self.logger.info(f"本次成功提取 {self.note_count} 个笔记，失败 {self.failed_count} 个，共 {len(self.users)} 个用户信息")
+            self.logger.info("提取完成")
+            
+        except Exception as e:
+            self.logger.error(f"提取过程出错: {str(e)}")
+            ok = False
+        finally:
+            if self.pipeline:
+                self.upload_ok = self.finish_feishu_pipeline()
+            for writer in (self.note_writer, self.user_writer):
+                if writer:
+                    writer.close()
+            self.note_writer = None
+            self.user_writer = None
+            if self.journal:
+                self.logger.info(f"断点日志: {self.journal.path} {self.journal.summary()}")
+                self.journal.close()
+                self.journal = None
+            if self.extractor:
+                self.extractor.close()
+            if self.store:
+                self.store.close()
+                self.store = None
+            if self.profile_cache:
+                self.profile_cache.save()
+            if self.watermarks:
+                self.watermarks.save()
+        
+        return ok
+    
+    def run_concurrent_extraction(self, items, total=None):
+        """使用并发引擎提取一组笔记，结果写入 self.notes / self.users
+
+        items 为生成器（如分页搜索）时边获取边提取，total 为预计数量（提取数量上限），用于显示进度。
+        """
+        journal = self.journal
+        on_progress = self.on_progress
+        
+        # 跳过断点日志中已完成的笔记，其余登记为待处理
+        if hasattr(items, "__len__"):
+            pending = []
+            for item in items:
+                note_id = self.extractor.extract_note_id(item) or item
+                if not journal.is_done("note", note_id):
+                    pending.append(item)
+            if len(pending) < len(items):
+                self.logger.info(f"跳过 {len(items) - len(pending)} 个已完成的笔记")
+            journal.mark_pending("note", [self.extractor.extract_note_id(item) or item for item in pending])
+        else:
+            # 跳过的笔记也计入进度
+            skipped = [0]
+            pending = self.iter_pending(items, skipped)
+            if self.on_progress:
+                on_progress = lambda done, total: self.on_progress(done + skipped[0], total)
+        
+        # 流式输出时笔记不必留在内存中（上传飞书也是边提取边写入），大批量提取时内存保持平稳
+        keep_results = not self.note_writer
+        
+        engine = SimpleExtractionEngine(self.extractor, max_workers=self.config["max_workers"], logger=self.logger)
+        notes, _ = engine.run(
+            pending,
+            users=self.users,
+            total=total,
+            is_running=self.is_running,
+            on_progress=on_progress,
+            on_note=self.on_note_done,
+            on_failed=lambda item: self.on_note_failed(self.extractor.extract_note_id(item) or item),
+            on_user=self.on_user_done,
+            keep_results=keep_results
+        )
+        self.notes.extend(notes)
+        if not hasattr(items, "__len__") and skipped[0]:
+            self.logger.info(f"跳过 {skipped[0]} 个已完成的笔记")
+        return notes
+    
+    @staticmethod
+    def record_listed(items, listed):
+        """原样产出 items，同时记录到 listed 中"""
+        for item in items:
+            listed.append(item)
+            yield item
+    
+    def check_listing(self, paging, listed, allow_empty=False):
+        """检查分页获取的结果，一个笔记都没有获取到时返回False，中途获取失败时记录到 listing_ok"""
+        if paging.get("stopped") == "error":
+            self.listing_ok = False
+        if not listed and not allow_empty:
+            self.logger.error("没有获取到任何笔记")
+            return False
+        if not self.listing_ok:
+            self.logger.warning(f"笔记列表获取中途失败，只提取了前 {len(listed)} 个笔记")
+        return True
+    
+    def iter_pending(self, items, skipped):
+        """逐个跳过已完成的笔记（计入 skipped[0]），其余登记为待处理后交给引擎"""
+        for item in items:
+            note_id = self.extractor.extract_note_id(item) or item
+            if self.journal.is_done("note", note_id):
+                skipped[0] += 1
+                continue
+            self.journal.mark_pending("note", [note_id])
+            yield item
+    
+    def open_stream_writers(self):
+        """按输出格式打开笔记和用户的流式输出"""
+        output_format = self.config["output_format"]
+        if output_format == "parquet" and not load_pyarrow():
+            self.logger.warning("未安装pyarrow，改为输出CSV")
+            output_format = "csv"
+        
+        notes_path, users_path = stream_output_paths(self.config["output_file"], "." + output_format)
+        if output_format == "jsonl":
+            # 续传时接着上次的文件写；中断前已记入断点日志但还没写入文件的结果在这里补上
+            self.note_writer = SimpleJsonlWriter(notes_path, append=self.config["resume"], key="note_id")
+            self.user_writer = SimpleJsonlWriter(users_path, append=self.config["resume"], key="user_id")
+            if self.config["resume"]:
+                for note in self.notes:
+                    if note.note_id not in self.note_writer.keys:
+                        self.note_writer.write(note.to_dict())
+                for user in self.users.values():
+                    if user.user_id not in self.user_writer.keys:
+                        self.user_writer.write(user.to_dict())
+        else:
+            # 表格文件每次重新生成，续传时先写入恢复的结果
+            self.note_writer = SimpleColumnarWriter(notes_path, Note)
+            self.user_writer = SimpleColumnarWriter(users_path, User)
+            for note in self.notes:
+                self.note_writer.write(note.to_dict())
+            for user in self.users.values():
+                self.user_writer.write(user.to_dict())
+        self.logger.info(f"流式输出到: {notes_path}, {users_path}")
+    
+    def on_note_done(self, note):
+        """笔记提取完成：写入断点日志、流式输出和飞书上传队列"""
+        self.note_count += 1
+        note_dict = note.to_dict()
+        self.journal.mark_done("note", note.note_id, note_dict)
+        if self.note_writer:
+            self.note_writer.write(note_dict)
+        if self.store:
+            keyword = self.config["keyword"] if self.config["extract_mode"] == "keyword" else None
+            self.store.add_note(note, keyword=keyword, note_dict=note_dict)
+        self.ensure_feishu_pipeline()
+        if self.pipeline:
+            self.pipeline.put(note)
+        if self.on_note:
+            self.on_note(note)
+    
+    def on_note_failed(self, note_id):
+        """笔记提取失败：记录到断点日志"""
+        self.failed_count += 1
+        self.journal.mark_failed("note", note_id)
+    
+    def on_user_done(self, user):
+        """用户信息提取完成：写入断点日志和流式输出"""
+        user_dict = user.to_dict()
+        self.journal.mark_done("user", user.user_id, user_dict)
+        if self.user_writer:
+            self.user_writer.write(user_dict)
+        if self.store:
+            self.store.add_user(user, user_dict=user_dict)
+    
+    def ensure_feishu_pipeline(self):
+        """第一次需要上传时准备飞书表格，准备失败时照常提取，只是不上传"""
+        if not self.feishu_pending:
+            return
+        self.feishu_pending = False
+        if not self.start_feishu_pipeline():
+            self.upload_ok = False
+    
+    def start_feishu_pipeline(self):
+        """准备飞书表格并启动上传流水线，提取过程中边提取边上传；失败时返回False"""
+        self.logger.info("准备上传到飞书多维表格")
+        
+        try:
+            # 初始化飞书认证
+            app_id = self.config["feishu_app_id"]
+            app_secret = self.config["feishu_app_secret"]
+            
+            auth = get_feishu_auth(app_id, app_secret, logger=self.logger)
+            bitable = SimpleFeishuBitable(auth, logger=self.logger, schema_cache=SimpleSchemaCache(logger=self.logger))
+            
+            # 获取或创建多维表格应用
+            app_token = self.config["app_token"]
+            if not app_token or self.config["create_table"]:
+                table_name = "小红书笔记"
+                self.logger.info(f"创建新的多维表格应用: {table_name}")
+                app_token = bitable.create_app(table_name)
+                if not app_token:
+                    self.logger.error("创建多维表格应用失败")
+                    return False
+                self.logger.info(f"成功创建多维表格应用，app_token: {app_token}")
+                self.config["app_token"] = app_token
+            else:
+                self.logger.info(f"使用现有的多维表格应用，app_token: {app_token}")
+            
+            # 获取或创建数据表
+            table_id = self.config["table_id"]
+            field_map = None
+            
+            if not table_id or self.config["create_table"]:
+                self.logger.info("创建新的数据表")
+                table_info = bitable.setup_xiaohongshu_table(app_token)
+                if not table_info:
+                    self.logger.error("创建数据表失败")
+                    return False
+                
+                table_id = table_info["table_id"]
+                field_map = table_info["field_map"]
+                self.logger.info(f"成功创建数据表，table_id: {table_id}")
+                self.config["table_id"] = table_id
+            else:
+                self.logger.info(f"使用现有的数据表，table_id: {table_id}")
+                # 获取字段映射（有缓存时不请求字段列表）
+                field_map = bitable.get_field_map(app_token, table_id)
+                if not field_map:
+                    self.logger.error("获取字段列表失败")
+                    return False
+            
+            # 增量同步：只创建新笔记，只更新有变化的记录
+            index = None
+            if self.config["incremental_sync"] and not self.config["create_table"]:
+                index = bitable.load_record_index(app_token, table_id, field_map)
+                if index is not None and self.store:
+                    self.store.add_feishu_records(app_token, table_id, index)
+                elif index is None and self.store:
+                    # 读取飞书失败时退回到上次同步时记录的映射
+                    index = self.store.load_feishu_index(app_token, table_id) or None
+                    if index is not None:
+                        self.logger.warning(f"加载已有记录失败，使用本地数据库中的 {len(index)} 条记录映射")
+                if index is None:
+                    self.logger.error("加载已有记录失败，无法增量同步")
+                    return False
+                self.logger.info(f"增量同步: 表格中已有 {len(index)} 条记录")
+            
+            self.pipeline = SimpleFeishuPipeline(
+                bitable, app_token, table_id, field_map, self.build_record,
+                index=index,
+                image_cache=SimpleUploadCache(logger=self.logger),
+                logger=self.logger,
+                on_written=self.on_notes_uploaded
+            )
+            
+            # 续传恢复的笔记中，中断前已写入这张表的不再写入，其余照常上传
+            self.upload_key = f"{app_token}:{table_id}"
+            uploaded = 0
+            for note in self.notes[:self.restored_count]:
+                if self.journal.is_done("upload", f"{self.upload_key}:{note.note_id}"):
+                    uploaded += 1
+                    continue
+                self.pipeline.put(note)
+            if uploaded:
+                self.logger.info(f"跳过 {uploaded} 个中断前已写入飞书的笔记")
+            
+            self.logger.info("飞书上传已启动，提取的笔记将分批写入")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"上传到飞书多维表格出错: {str(e)}")
+            return False
+    
+    def on_notes_uploaded(self, note_ids):
+        """在断点日志中记录已写入飞书的笔记，续传时不重复创建"""
+        self.journal.mark_done_many("upload", [f"{self.upload_key}:{note_id}" for note_id in note_ids])
+    
+    def build_record(self, note):
+        """把笔记转换为飞书记录（在上传线程中调用）"""
+        pipeline = self.pipeline
+        
+        # 获取图片路径
+        image_paths = []
+        if note.image_list and self.config["download_images"]:
+            image_paths = self.extractor.get_image_paths(note)
+        
+        return pipeline.bitable.convert_xiaohongshu_note_to_record(note, self.users.get(note.user_id), pipeline.field_map, image_paths)
+    
+    def finish_feishu_pipeline(self):
+        """等待上传流水线写完剩余记录，返回上传是否全部成功"""
+        pipeline = self.pipeline
+        try:
+            stats = pipeline.close()
+            bitable = pipeline.bitable
+            field_map = pipeline.field_map
+            app_token = pipeline.app_token
+            table_id = pipeline.table_id
+            
+            # 记录笔记与飞书记录的对应关系
+            if self.store and "笔记ID" in field_map:
+                written = {}
+                for payload, record_id in bitable.written_records:
+                    fields = payload.get("fields") or {}
+                    note_id = bitable.normalize_field_value(fields.get(field_map["笔记ID"]))
+                    if note_id:
+                        written[note_id] = {"record_id": record_id, "fingerprint": bitable.record_fingerprint(fields, field_map)}
+                self.store.add_feishu_records(app_token, table_id, written)
+            
+            # 保存重试后仍写入失败的记录，便于之后重新上传
+            if bitable.failed_records:
+                failed_file = os.path.splitext(self.config["output_file"])[0] + "_feishu_failed.json"
+                with open(failed_file, "w", encoding="utf-8") as f:
+                    json.dump({"app_token": app_token, "table_id": table_id, "records": bitable.failed_records}, f, ensure_ascii=False, indent=2)
+                self.logger.error(f"{len(bitable.failed_records)} 条记录写入飞书失败，已保存到: {failed_file}")
+            
+            self.logger.info(f"飞书上传完成: 新增 {stats['created']} 条，更新 {stats['updated']} 条，未变化跳过 {stats['skipped']} 条")
+            if stats["errors"]:
+                self.logger.error(f"{stats['errors']} 个笔记转换或写入时出错")
+            return not bitable.failed_records and not stats["errors"]
+            
+        except Exception as e:
+            self.logger.error(f"上传到飞书多维表格出错: {str(e)}")
+            return False
+        finally:
+            self.pipeline = None
+# 结果列表模型
+RESULT_PAGE_SIZE = 500
+
+class SimpleResultModel:
+    def __init__(self, page_size=RESULT_PAGE_SIZE):
+        self.page_size = page_size
+        # note_id -> Note，按到达顺序排列的 note_id，以及 note_id -> 位置
+        self.index = {}
+        self.order = []
+        self.positions = {}
+    
+    def add(self, note):
+        """添加或更新笔记，返回 (位置, 是否新笔记)"""
+        if note.note_id in self.index:
+            self.index[note.note_id] = note
+            return self.positions[note.note_id], False
+        self.index[note.note_id] = note
+        self.positions[note.note_id] = len(self.order)
+        self.order.append(note.note_id)
+        return len(self.order) - 1, True
+    
+    def get(self, note_id):
+        return self.index.get(note_id)
+    
+    def page_count(self):
+        return max(1, (len(self.order) + self.page_size - 1) // self.page_size)
+    
+    def page_notes(self, page):
+        start = page * self.page_size
+        return [self.index[note_id] for note_id in self.order[start:start + self.page_size]]
+    
+    @staticmethod
+    def row(note):
+        """笔记在列表中的一行"""
+        return (note.title, note.nickname, note.liked_count, note.comment_count)
+    
+    def __len__(self):
+        return len(self.order)
 
 # GUI界面
 class SimpleXiaohongshuFeishuGUI:
@@ -915,6 +3863,7 @@ class SimpleXiaohongshuFeishuGUI:
         self.root = root
         self.root.title("小红书笔记提取并上传飞书多维表格工具")
         self.root.geometry("800x600")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # 创建变量
         self.xhs_cookie = tk.StringVar()
@@ -927,14 +3876,25 @@ class SimpleXiaohongshuFeishuGUI:
         self.keyword = tk.StringVar()
         self.user_id = tk.StringVar()
         self.count = tk.IntVar(value=10)
+        self.max_workers = tk.IntVar(value=4)
+        self.image_workers = tk.IntVar(value=8)
+        self.max_download_kbps = tk.IntVar(value=0)
         self.sort_type = tk.IntVar(value=0)
         self.download_images = tk.BooleanVar(value=True)
         self.upload_to_feishu = tk.BooleanVar(value=False)
         self.create_table = tk.BooleanVar(value=True)
+        self.incremental_sync = tk.BooleanVar(value=False)
         self.app_token = tk.StringVar()
         self.table_id = tk.StringVar()
         self.save_to_file = tk.BooleanVar(value=True)
+        self.resume = tk.BooleanVar(value=False)
         self.output_file = tk.StringVar(value="results.json")
+        self.output_format = tk.StringVar(value="json")
+        self.log_file = tk.StringVar()
+        self.log_json = tk.BooleanVar(value=False)
+        self.save_to_db = tk.BooleanVar(value=True)
+        self.profile_ttl_hours = tk.IntVar(value=24)
+        self.only_new_notes = tk.BooleanVar(value=False)
         
         # 创建配置目录
         os.makedirs("gui_configs", exist_ok=True)
@@ -942,13 +3902,17 @@ class SimpleXiaohongshuFeishuGUI:
         # 加载配置列表
         self.config_list = self.load_config_list()
         
+        # 结果列表：提取线程把笔记放入队列，界面线程定时取出分页显示
+        self.results = SimpleResultModel()
+        self.result_queue = queue.SimpleQueue()
+        self.result_page = 0
+        
         # 创建主框架
         self.create_widgets()
+        self.root.after(200, self.drain_results)
         
-        # 初始化提取器和结果
-        self.extractor = None
-        self.notes = []
-        self.users = {}
+        # 初始化提取任务和结果
+        self.job = None
         self.running = False
         
     def create_widgets(self):
@@ -1049,6 +4013,7 @@ class SimpleXiaohongshuFeishuGUI:
         self.user_frame = ttk.Frame(param_frame)
         ttk.Label(self.user_frame, text="用户ID:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
         ttk.Entry(self.user_frame, textvariable=self.user_id, width=50).grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+        ttk.Checkbutton(self.user_frame, text="只提取上次之后发布的新笔记", variable=self.only_new_notes).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
         
         # 批量URL输入
         self.batch_frame = ttk.Frame(param_frame)
@@ -1062,6 +4027,14 @@ class SimpleXiaohongshuFeishuGUI:
         ttk.Label(common_frame, text="提取数量:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
         ttk.Spinbox(common_frame, from_=1, to=100, textvariable=self.count, width=10).grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
         ttk.Checkbutton(common_frame, text="下载图片", variable=self.download_images).grid(row=0, column=2, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(common_frame, text="并发数:").grid(row=0, column=3, padx=5, pady=5, sticky=tk.W)
+        ttk.Spinbox(common_frame, from_=1, to=16, textvariable=self.max_workers, width=5).grid(row=0, column=4, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(common_frame, text="图片并发:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        ttk.Spinbox(common_frame, from_=1, to=32, textvariable=self.image_workers, width=10).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(common_frame, text="下载限速(KB/s，0为不限):").grid(row=1, column=2, padx=5, pady=5, sticky=tk.W)
+        ttk.Entry(common_frame, textvariable=self.max_download_kbps, width=8).grid(row=1, column=3, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(common_frame, text="用户信息缓存(小时，0为不缓存):").grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        ttk.Spinbox(common_frame, from_=0, to=720, textvariable=self.profile_ttl_hours, width=8).grid(row=2, column=2, padx=5, pady=5, sticky=tk.W)
         
         # 输出选项
         output_frame = ttk.LabelFrame(extract_frame, text="输出选项")
@@ -1071,6 +4044,10 @@ class SimpleXiaohongshuFeishuGUI:
         ttk.Label(output_frame, text="输出文件:").grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
         ttk.Entry(output_frame, textvariable=self.output_file, width=30).grid(row=0, column=2, padx=5, pady=5, sticky=tk.W)
         ttk.Button(output_frame, text="选择文件", command=self.select_output_file).grid(row=0, column=3, padx=5, pady=5)
+        ttk.Label(output_frame, text="格式:").grid(row=0, column=4, padx=5, pady=5, sticky=tk.W)
+        ttk.Combobox(output_frame, textvariable=self.output_format, values=["json", "jsonl", "csv", "parquet"], width=8, state="readonly").grid(row=0, column=5, padx=5, pady=5, sticky=tk.W)
+        ttk.Checkbutton(output_frame, text="断点续传（跳过上次已完成的笔记）", variable=self.resume).grid(row=1, column=0, columnspan=3, padx=5, pady=5, sticky=tk.W)
+        ttk.Checkbutton(output_frame, text="保存到本地数据库", variable=self.save_to_db).grid(row=1, column=3, columnspan=3, padx=5, pady=5, sticky=tk.W)
         
         # 执行按钮
         btn_frame = ttk.Frame(extract_frame)
@@ -1106,6 +4083,7 @@ class SimpleXiaohongshuFeishuGUI:
         upload_frame.pack(fill=tk.X, padx=10, pady=10)
         
         ttk.Checkbutton(upload_frame, text="上传到飞书多维表格", variable=self.upload_to_feishu).grid(row=0, column=0, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        ttk.Checkbutton(upload_frame, text="增量同步（使用现有表格时更新已有笔记，不重复添加）", variable=self.incremental_sync).grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky=tk.W)
         
         # 表格选项
         table_frame = ttk.LabelFrame(feishu_frame, text="表格选项")
@@ -1142,6 +4120,17 @@ class SimpleXiaohongshuFeishuGUI:
         # 绑定选择事件
         self.note_tree.bind("<<TreeviewSelect>>", self.on_note_select)
         
+        # 分页，每页显示 RESULT_PAGE_SIZE 条
+        page_frame = ttk.Frame(list_frame)
+        page_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+        
+        ttk.Button(page_frame, text="上一页", command=lambda: self.show_page(self.result_page - 1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(page_frame, text="下一页", command=lambda: self.show_page(self.result_page + 1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(page_frame, text="最后一页", command=lambda: self.show_page(self.results.page_count() - 1)).pack(side=tk.LEFT, padx=5)
+        self.page_label = ttk.Label(page_frame, text="")
+        self.page_label.pack(side=tk.LEFT, padx=10)
+        self.update_page_label()
+        
         # 笔记详情
         detail_frame = ttk.LabelFrame(result_frame, text="笔记详情")
         detail_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -1154,12 +4143,22 @@ class SimpleXiaohongshuFeishuGUI:
         log_frame = ttk.Frame(self.notebook)
         self.notebook.add(log_frame, text="日志")
         
+        # 日志文件设置
+        log_file_frame = ttk.Frame(log_frame)
+        log_file_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        
+        ttk.Label(log_file_frame, text="日志文件:").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(log_file_frame, textvariable=self.log_file, width=40).pack(side=tk.LEFT, padx=5)
+        ttk.Button(log_file_frame, text="选择文件", command=self.select_log_file).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(log_file_frame, text="JSON格式", variable=self.log_json).pack(side=tk.LEFT, padx=5)
+        
         # 日志文本框
         self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD)
         self.log_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # 创建日志处理器
+        # 创建日志处理器，由界面线程定时把日志写入文本框
         self.logger = SimpleLogger(self.log_text)
+        self.logger.start_drain(self.root)
         
     def update_extract_mode(self, *args):
         # 隐藏所有参数框架
@@ -1210,14 +4209,25 @@ class SimpleXiaohongshuFeishuGUI:
             self.keyword.set(config.get("keyword", ""))
             self.user_id.set(config.get("user_id", ""))
             self.count.set(config.get("count", 10))
+            self.max_workers.set(config.get("max_workers", 4))
+            self.image_workers.set(config.get("image_workers", 8))
+            self.max_download_kbps.set(config.get("max_download_kbps", 0))
             self.sort_type.set(config.get("sort_type", 0))
             self.download_images.set(config.get("download_images", True))
             self.upload_to_feishu.set(config.get("upload_to_feishu", False))
             self.create_table.set(config.get("create_table", True))
+            self.incremental_sync.set(config.get("incremental_sync", False))
             self.app_token.set(config.get("app_token", ""))
             self.table_id.set(config.get("table_id", ""))
             self.save_to_file.set(config.get("save_to_file", True))
+            self.resume.set(config.get("resume", False))
             self.output_file.set(config.get("output_file", "results.json"))
+            self.output_format.set(config.get("output_format", "json"))
+            self.log_file.set(config.get("log_file", ""))
+            self.log_json.set(config.get("log_json", False))
+            self.save_to_db.set(config.get("save_to_db", True))
+            self.profile_ttl_hours.set(config.get("profile_ttl_hours", 24))
+            self.only_new_notes.set(config.get("only_new_notes", False))
             
             if "batch_file" in config:
                 self.batch_file_var.set(config["batch_file"])
@@ -1234,26 +4244,7 @@ class SimpleXiaohongshuFeishuGUI:
             messagebox.showwarning("警告", "请输入配置名称")
             return
         
-        config = {
-            "xhs_cookie": self.xhs_cookie.get(),
-            "feishu_app_id": self.feishu_app_id.get(),
-            "feishu_app_secret": self.feishu_app_secret.get(),
-            "output_dir": self.output_dir.get(),
-            "extract_mode": self.extract_mode.get(),
-            "note_url": self.note_url.get(),
-            "keyword": self.keyword.get(),
-            "user_id": self.user_id.get(),
-            "count": self.count.get(),
-            "sort_type": self.sort_type.get(),
-            "download_images": self.download_images.get(),
-            "upload_to_feishu": self.upload_to_feishu.get(),
-            "create_table": self.create_table.get(),
-            "app_token": self.app_token.get(),
-            "table_id": self.table_id.get(),
-            "save_to_file": self.save_to_file.get(),
-            "output_file": self.output_file.get(),
-            "batch_file": self.batch_file_var.get()
-        }
+        config = self.get_config()
         
         config_file = os.path.join("gui_configs", f"{config_name}.json")
         
@@ -1321,6 +4312,12 @@ class SimpleXiaohongshuFeishuGUI:
         if file_path:
             self.batch_file_var.set(file_path)
     
+    def select_log_file(self):
+        """选择日志文件"""
+        file_path = filedialog.asksaveasfilename(title="选择日志文件", defaultextension=".log", filetypes=[("日志文件", "*.log"), ("所有文件", "*.*")])
+        if file_path:
+            self.log_file.set(file_path)
+    
     def select_output_file(self):
         """选择输出文件"""
         file_path = filedialog.asksaveasfilename(title="选择输出文件", defaultextension=".json", filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")])
@@ -1342,9 +4339,12 @@ class SimpleXiaohongshuFeishuGUI:
                 logger=self.logger
             )
             
-            # 测试搜索功能
+            # 测试搜索功能，结束后关闭提取器的会话和下载线程
             self.logger.info("测试小红书配置...")
-            note_ids = extractor.search_notes("测试", sort_type=0, limit=1)
+            try:
+                note_ids = extractor.search_notes("测试", sort_type=0, limit=1)
+            finally:
+                extractor.close()
             
             if note_ids:
                 messagebox.showinfo("成功", "小红书配置测试成功")
@@ -1365,7 +4365,7 @@ class SimpleXiaohongshuFeishuGUI:
         
         try:
             # 初始化认证
-            auth = SimpleFeishuAuth(app_id, app_secret, logger=self.logger)
+            auth = get_feishu_auth(app_id, app_secret, logger=self.logger)
             
             # 测试获取token
             self.logger.info("测试飞书配置...")
@@ -1382,35 +4382,14 @@ class SimpleXiaohongshuFeishuGUI:
     def start_extraction(self):
         """开始提取数据"""
         # 检查配置
-        cookie = self.xhs_cookie.get()
-        if not cookie:
-            messagebox.showwarning("警告", "请输入小红书Cookie")
-            return
-        
-        # 检查提取模式
-        mode = self.extract_mode.get()
-        if mode == "url" and not self.note_url.get():
-            messagebox.showwarning("警告", "请输入笔记URL")
-            return
-        elif mode == "keyword" and not self.keyword.get():
-            messagebox.showwarning("警告", "请输入关键词")
-            return
-        elif mode == "user" and not self.user_id.get():
-            messagebox.showwarning("警告", "请输入用户ID")
-            return
-        elif mode == "batch" and not self.batch_file_var.get():
-            messagebox.showwarning("警告", "请选择URL列表文件")
+        error = validate_config(self.get_config())
+        if error:
+            messagebox.showwarning("警告", error)
             return
         
-        # 检查飞书配置
-        if self.upload_to_feishu.get():
-            if not self.feishu_app_id.get() or not self.feishu_app_secret.get():
-                messagebox.showwarning("警告", "请输入飞书App ID和App Secret")
-                return
-            
-            if not self.create_table.get() and (not self.app_token.get() or not self.table_id.get()):
-                messagebox.showwarning("警告", "请输入应用Token和表格ID")
-                return
+        # 日志文件设置
+        self.logger.json_format = self.log_json.get()
+        self.logger.set_log_file(self.log_file.get())
         
         # 更新UI状态
         self.start_btn["state"] = tk.DISABLED
@@ -1418,10 +4397,10 @@ class SimpleXiaohongshuFeishuGUI:
         self.running = True
         self.progress_bar["value"] = 0
         
-        # 清空结果
-        self.notes = []
-        self.users = {}
-        self.note_tree.delete(*self.note_tree.get_children())
+        # 清空结果，上次运行残留在旧队列中的笔记直接丢弃
+        self.results = SimpleResultModel()
+        self.result_queue = queue.SimpleQueue()
+        self.show_page(0)
         self.detail_text.delete(1.0, tk.END)
         
         # 启动提取线程
@@ -1429,270 +4408,63 @@ class SimpleXiaohongshuFeishuGUI:
         self.extract_thread.daemon = True
         self.extract_thread.start()
     
+    def get_config(self):
+        """当前界面上的配置"""
+        return {
+            "xhs_cookie": self.xhs_cookie.get(),
+            "feishu_app_id": self.feishu_app_id.get(),
+            "feishu_app_secret": self.feishu_app_secret.get(),
+            "output_dir": self.output_dir.get(),
+            "extract_mode": self.extract_mode.get(),
+            "note_url": self.note_url.get(),
+            "keyword": self.keyword.get(),
+            "user_id": self.user_id.get(),
+            "count": self.count.get(),
+            "max_workers": self.max_workers.get(),
+            "image_workers": self.image_workers.get(),
+            "max_download_kbps": self.max_download_kbps.get(),
+            "sort_type": self.sort_type.get(),
+            "download_images": self.download_images.get(),
+            "upload_to_feishu": self.upload_to_feishu.get(),
+            "create_table": self.create_table.get(),
+            "incremental_sync": self.incremental_sync.get(),
+            "app_token": self.app_token.get(),
+            "table_id": self.table_id.get(),
+            "save_to_file": self.save_to_file.get(),
+            "resume": self.resume.get(),
+            "output_file": self.output_file.get(),
+            "output_format": self.output_format.get(),
+            "batch_file": self.batch_file_var.get(),
+            "log_file": self.log_file.get(),
+            "log_json": self.log_json.get(),
+            "save_to_db": self.save_to_db.get(),
+            "profile_ttl_hours": self.profile_ttl_hours.get(),
+            "only_new_notes": self.only_new_notes.get()
+        }
+    
     def run_extraction(self):
         """运行提取过程"""
         try:
-            # 初始化提取器
-            self.extractor = SimpleXHSExtractor(
-                cookie=self.xhs_cookie.get(),
-                output_dir=self.output_dir.get(),
-                logger=self.logger
+            self.job = SimpleExtractionJob(
+                self.get_config(),
+                logger=self.logger,
+                is_running=lambda: self.running,
+                on_progress=lambda done, total: self.root.after(0, self.update_progress, done, total),
+                on_note=self.result_queue.put
             )
+            self.job.run()
             
-            # 根据模式提取数据
-            mode = self.extract_mode.get()
-            count = self.count.get()
-            
-            if mode == "url":
-                # 提取单个笔记
-                url = self.note_url.get()
-                self.logger.info(f"提取单个笔记: {url}")
-                note = self.extractor.extract_note(url)
-                if note:
-                    self.logger.info(f"成功提取笔记: {note.title}")
-                    self.notes.append(note)
-                    
-                    # 提取用户信息
-                    if note.user_id:
-                        user = self.extractor.extract_user(note.user_id)
-                        if user:
-                            self.users[note.user_id] = user
-                else:
-                    self.logger.error("笔记提取失败")
-                
-            elif mode == "keyword":
-                # 搜索并提取笔记
-                keyword = self.keyword.get()
-                sort_type = self.sort_type.get()
-                self.logger.info(f"搜索笔记: {keyword}")
-                note_ids = self.extractor.search_notes(keyword, sort_type=sort_type)
-                
-                # 限制数量
-                if count and count < len(note_ids):
-                    note_ids = note_ids[:count]
-                
-                self.logger.info(f"开始提取 {len(note_ids)} 个笔记")
-                for i, note_id in enumerate(note_ids):
-                    if not self.running:
-                        break
-                    
-                    self.logger.info(f"提取第 {i+1}/{len(note_ids)} 个笔记: {note_id}")
-                    note = self.extractor.extract_note(note_id)
-                    if note:
-                        self.logger.info(f"成功提取笔记: {note.title}")
-                        self.notes.append(note)
-                        
-                        # 提取用户信息
-                        if note.user_id and note.user_id not in self.users:
-                            user = self.extractor.extract_user(note.user_id)
-                            if user:
-                                self.users[note.user_id] = user
-                    else:
-                        self.logger.error(f"笔记 {note_id} 提取失败")
-                    
-                    # 更新进度
-                    self.root.after(0, lambda i=i, total=len(note_ids): self.update_progress(i+1, total))
-                
-            elif mode == "user":
-                # 提取用户的所有笔记
-                user_id = self.user_id.get()
-                self.logger.info(f"提取用户笔记: {user_id}")
-                
-                # 提取用户信息
-                user = self.extractor.extract_user(user_id)
-                if user:
-                    self.users[user.user_id] = user
-                    
-                    # 提取用户笔记
-                    user_notes = self.extractor.extract_user_notes(user_id, count)
-                    self.notes.extend(user_notes)
-                    self.logger.info(f"成功提取 {len(user_notes)} 个笔记")
-                else:
-                    self.logger.error(f"用户 {user_id} 提取失败")
-                
-            elif mode == "batch":
-                # 从文件加载URL列表
-                batch_file = self.batch_file_var.get()
-                if not os.path.exists(batch_file):
-                    self.logger.error(f"URL列表文件不存在: {batch_file}")
-                    return
-                
-                with open(batch_file, 'r', encoding='utf-8') as f:
-                    urls = [line.strip() for line in f if line.strip()]
-                
-                # 限制数量
-                if count and count < len(urls):
-                    urls = urls[:count]
-                
-                self.logger.info(f"从文件加载了 {len(urls)} 个URL")
-                for i, url in enumerate(urls):
-                    if not self.running:
-                        break
-                    
-                    self.logger.info(f"提取第 {i+1}/{len(urls)} 个笔记: {url}")
-                    note = self.extractor.extract_note(url)
-                    if note:
-                        self.logger.info(f"成功提取笔记: {note.title}")
-                        self.notes.append(note)
-                        
-                        # 提取用户信息
-                        if note.user_id and note.user_id not in self.users:
-                            user = self.extractor.extract_user(note.user_id)
-                            if user:
-                                self.users[note.user_id] = user
-                    else:
-                        self.logger.error(f"笔记 {url} 提取失败")
-                    
-                    # 更新进度
-                    self.root.after(0, lambda i=i, total=len(urls): self.update_progress(i+1, total))
-            
-            # 保存结果到文件
-            if self.save_to_file.get() and self.notes:
-                output_file = self.output_file.get()
-                self.logger.info(f"保存结果到文件: {output_file}")
-                
-                # 转换为可序列化的格式
-                result = {
-                    "notes": [note.to_dict() for note in self.notes],
-                    "users": {user_id: user.to_dict() for user_id, user in self.users.items()}
-                }
-                
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(result, f, ensure_ascii=False, indent=2)
-                
-                self.logger.info(f"成功保存结果到文件: {output_file}")
-            
-            # 上传到飞书多维表格
-            if self.upload_to_feishu.get() and self.notes:
-                self.upload_to_feishu_bitable()
-            
-            # 更新结果显示
-            self.root.after(0, self.update_result_display)
+            # 断点续传恢复的笔记不经过 on_note，结束时补充到列表
+            for note in self.job.notes[:self.job.restored_count]:
+                self.result_queue.put(note)
             
-            self.logger.info(f"成功提取 {len(self.notes)} 个笔记，{len(self.users)} 个用户信息")
-            self.logger.info("提取完成")
-            
-        except Exception as e:
-            self.logger.error(f"提取过程出错: {str(e)}")
+            # 新建的多维表格回填到界面
+            self.root.after(0, self.app_token.set, self.job.config["app_token"])
+            self.root.after(0, self.table_id.set, self.job.config["table_id"])
         finally:
             # 恢复UI状态
             self.root.after(0, self.reset_ui)
     
-    def upload_to_feishu_bitable(self):
-        """上传数据到飞书多维表格"""
-        self.logger.info("开始上传数据到飞书多维表格")
-        
-        try:
-            # 初始化飞书认证
-            app_id = self.feishu_app_id.get()
-            app_secret = self.feishu_app_secret.get()
-            
-            auth = SimpleFeishuAuth(app_id, app_secret, logger=self.logger)
-            bitable = SimpleFeishuBitable(auth, logger=self.logger)
-            
-            # 获取或创建多维表格应用
-            app_token = self.app_token.get()
-            if not app_token or self.create_table.get():
-                table_name = "小红书笔记"
-                self.logger.info(f"创建新的多维表格应用: {table_name}")
-                app_token = bitable.create_app(table_name)
-                if not app_token:
-                    self.logger.error("创建多维表格应用失败")
-                    return
-                self.logger.info(f"成功创建多维表格应用，app_token: {app_token}")
-                self.app_token.set(app_token)
-            else:
-                self.logger.info(f"使用现有的多维表格应用，app_token: {app_token}")
-            
-            # 获取或创建数据表
-            table_id = self.table_id.get()
-            field_map = None
-            
-            if not table_id or self.create_table.get():
-                self.logger.info("创建新的数据表")
-                table_info = bitable.setup_xiaohongshu_table(app_token)
-                if not table_info:
-                    self.logger.error("创建数据表失败")
-                    return
-                
-                table_id = table_info["table_id"]
-                field_map = table_info["field_map"]
-                self.logger.info(f"成功创建数据表，table_id: {table_id}")
-                self.table_id.set(table_id)
-            else:
-                self.logger.info(f"使用现有的数据表，table_id: {table_id}")
-                # 获取字段列表
-                fields = bitable.list_fields(app_token, table_id)
-                if not fields:
-                    self.logger.error("获取字段列表失败")
-                    return
-                
-                # 构建字段映射
-                field_map = {}
-                for field in fields:
-                    field_name = field.get("field_name")
-                    field_id = field.get("field_id")
-                    if field_name and field_id:
-                        field_map[field_name] = field_id
-            
-            # 上传数据
-            records = []
-            for note in self.notes:
-                # 获取对应的用户信息
-                user = None
-                if note.user_id in self.users:
-                    user = self.users[note.user_id]
-                
-                # 获取图片路径
-                image_paths = []
-                if hasattr(note, "image_list") and note.image_list and self.download_images.get():
-                    note_dir = os.path.join(self.output_dir.get(), f"{note.nickname}_{note.user_id}", f"{note.title}_{note.note_id}")
-                    for i in range(len(note.image_list)):
-                        img_path = os.path.join(note_dir, f"image_{i}.jpg")
-                        if os.path.exists(img_path):
-                            image_paths.append(img_path)
-                
-                # 转换为记录
-                record = bitable.convert_xiaohongshu_note_to_record(note, user, field_map, image_paths)
-                if record:
-                    records.append(record)
-            
-            if not records:
-                self.logger.warning("没有可上传的记录")
-                return
-            
-            self.logger.info(f"准备上传 {len(records)} 条记录")
-            
-            # 上传图片
-            for record in records:
-                if "_image_paths" in record and "图片" in field_map:
-                    image_tokens = []
-                    for image_path in record["_image_paths"]:
-                        if os.path.exists(image_path):
-                            file_token = bitable.upload_image(app_token, table_id, field_map["图片"], image_path)
-                            if file_token:
-                                image_tokens.append({"file_token": file_token})
-                    
-                    if image_tokens:
-                        record[field_map["图片"]] = image_tokens
-                    
-                    # 删除临时字段
-                    del record["_image_paths"]
-            
-            # 批量创建记录
-            record_ids = bitable.batch_create_records(app_token, table_id, records)
-            
-            if record_ids:
-                self.logger.info(f"成功上传 {len(record_ids)} 条记录")
-                return True
-            else:
-                self.logger.error("上传记录失败")
-                return False
-            
-        except Exception as e:
-            self.logger.error(f"上传到飞书多维表格出错: {str(e)}")
-            return False
-    
     def update_progress(self, current, total):
         """更新进度条"""
         progress = int(current / total * 100)
@@ -1705,23 +4477,48 @@ class SimpleXiaohongshuFeishuGUI:
         self.running = False
         self.progress_bar["value"] = 100
     
+    def on_close(self):
+        """关闭窗口前把日志写完"""
+        self.logger.close()
+        self.root.destroy()
+    
     def stop_extraction(self):
         """停止提取"""
         self.running = False
         self.logger.info("正在停止提取...")
     
-    def update_result_display(self):
-        """更新结果显示"""
-        # 清空树形视图
-        self.note_tree.delete(*self.note_tree.get_children())
-        
-        # 添加笔记到树形视图
-        for note in self.notes:
-            user_name = note.nickname if hasattr(note, "nickname") else ""
-            likes = note.liked_count if hasattr(note, "liked_count") else 0
-            comments = note.comment_count if hasattr(note, "comment_count") else 0
+    def drain_results(self, batch_size=1000):
+        """定时把新提取的笔记加入结果列表，只有当前页的行才写入树形视图"""
+        added = 0
+        while added < batch_size:
+            try:
+                note = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            added += 1
             
-            self.note_tree.insert("", tk.END, iid=note.note_id, values=(note.title, user_name, likes, comments))
+            position, is_new = self.results.add(note)
+            if position // self.results.page_size != self.result_page:
+                continue
+            if is_new:
+                self.note_tree.insert("", tk.END, iid=note.note_id, values=self.results.row(note))
+            else:
+                self.note_tree.item(note.note_id, values=self.results.row(note))
+        
+        if added:
+            self.update_page_label()
+        self.root.after(1 if added == batch_size else 200, self.drain_results)
+    
+    def show_page(self, page):
+        """显示指定页的笔记"""
+        self.result_page = min(max(page, 0), self.results.page_count() - 1)
+        self.note_tree.delete(*self.note_tree.get_children())
+        for note in self.results.page_notes(self.result_page):
+            self.note_tree.insert("", tk.END, iid=note.note_id, values=self.results.row(note))
+        self.update_page_label()
+    
+    def update_page_label(self):
+        self.page_label["text"] = f"第 {self.result_page + 1}/{self.results.page_count()} 页，共 {len(self.results)} 个笔记"
     
     def on_note_select(self, event):
         """笔记选择事件"""
@@ -1729,15 +4526,7 @@ class SimpleXiaohongshuFeishuGUI:
         if not selected_items:
             return
         
-        note_id = selected_items[0]
-        
-        # 查找对应的笔记
-        selected_note = None
-        for note in self.notes:
-            if note.note_id == note_id:
-                selected_note = note
-                break
-        
+        selected_note = self.results.get(selected_items[0])
         if not selected_note:
             return
         
@@ -1752,17 +4541,183 @@ class SimpleXiaohongshuFeishuGUI:
         detail_text += f"评论数: {selected_note.comment_count}\n"
         detail_text += f"分享数: {selected_note.share_count}\n"
         
-        if hasattr(selected_note, "tag_list") and selected_note.tag_list:
+        if selected_note.tag_list:
             detail_text += f"标签: {', '.join(selected_note.tag_list)}\n"
         
         detail_text += f"\n内容:\n{selected_note.desc}\n"
         
         self.detail_text.insert(tk.END, detail_text)
 
-def main():
+# 命令行模式
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_CONFIG_ERROR = 2
+EXIT_PARTIAL = 3
+EXIT_INTERRUPTED = 130
+
+def load_config_file(name_or_path):
+    """按路径或 gui_configs 中的配置名读取配置"""
+    path = name_or_path
+    if not os.path.exists(path):
+        path = os.path.join("gui_configs", f"{name_or_path}.json")
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def build_cli_parser():
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="小红书笔记提取并上传飞书多维表格（命令行模式，不需要图形界面）",
+        epilog="进度以JSON行输出到stdout，日志输出到stderr。"
+               "退出码: 0成功，1失败，2配置错误，3部分笔记或上传失败，130被中断"
+    )
+    parser.add_argument("-c", "--config", help="配置名（gui_configs 下的文件名）或配置文件路径")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="提取单个笔记")
+    target.add_argument("--keyword", help="按关键词搜索并提取")
+    target.add_argument("--user-id", help="提取用户的笔记")
+    target.add_argument("--batch-file", help="从URL列表文件批量提取")
+    parser.add_argument("--cookie-file", help="从文件读取小红书Cookie")
+    parser.add_argument("--count", type=int, help="提取数量")
+    parser.add_argument("--sort-type", type=int, choices=[0, 1, 2], help="排序方式: 0综合 1最热 2最新")
+    parser.add_argument("--max-workers", type=int, help="笔记并发数")
+    parser.add_argument("--output-dir", help="图片输出目录")
+    parser.add_argument("--output-file", help="结果文件")
+    parser.add_argument("--output-format", choices=["json", "jsonl", "csv", "parquet"], help="结果格式")
+    parser.add_argument("--resume", action="store_true", default=None, help="断点续传")
+    parser.add_argument("--profile-ttl-hours", type=int, help="用户信息缓存有效期（小时），0为不缓存")
+    parser.add_argument("--only-new", dest="only_new_notes", action="store_true", default=None, help="用户笔记只提取上次之后发布的")
+    parser.add_argument("--no-db", dest="save_to_db", action="store_false", default=None, help="不保存到本地数据库")
+    parser.add_argument("--log-file", help="日志同时写入文件（按大小轮转）")
+    parser.add_argument("--log-json", action="store_true", default=None, help="日志每行输出一个JSON对象")
+    upload = parser.add_mutually_exclusive_group()
+    upload.add_argument("--upload", dest="upload_to_feishu", action="store_true", default=None, help="上传到飞书多维表格")
+    upload.add_argument("--no-upload", dest="upload_to_feishu", action="store_false", help="不上传到飞书")
+    return parser
+
+def cli_main(argv=None):
+    """命令行入口，返回退出码"""
+    args = build_cli_parser().parse_args(argv)
+    logger = SimpleLogger(stream=sys.stderr)
+    output_lock = threading.Lock()
+    
+    def emit(event, **data):
+        with output_lock:
+            print(json.dumps(dict(event=event, **data), ensure_ascii=False), flush=True)
+    
+    # 配置优先级：命令行参数 > 环境变量 > 配置文件
+    config = {}
+    try:
+        if args.config:
+            config.update(load_config_file(args.config))
+        if args.cookie_file:
+            with open(args.cookie_file, "r", encoding="utf-8") as f:
+                config["xhs_cookie"] = f.read().strip()
+    except (OSError, ValueError) as e:
+        logger.error(f"读取配置失败: {str(e)}")
+        return EXIT_CONFIG_ERROR
+    
+    for key, env in (("xhs_cookie", "XHS_COOKIE"), ("feishu_app_id", "FEISHU_APP_ID"), ("feishu_app_secret", "FEISHU_APP_SECRET")):
+        if os.environ.get(env):
+            config[key] = os.environ[env]
+    
+    for mode, key, value in (("url", "note_url", args.url), ("keyword", "keyword", args.keyword),
+                             ("user", "user_id", args.user_id), ("batch", "batch_file", args.batch_file)):
+        if value:
+            config["extract_mode"] = mode
+            config[key] = value
+    
+    overrides = {
+        "count": args.count,
+        "sort_type": args.sort_type,
+        "max_workers": args.max_workers,
+        "output_dir": args.output_dir,
+        "output_file": args.output_file,
+        "output_format": args.output_format,
+        "resume": args.resume,
+        "upload_to_feishu": args.upload_to_feishu,
+        "log_file": args.log_file,
+        "log_json": args.log_json,
+        "save_to_db": args.save_to_db,
+        "profile_ttl_hours": args.profile_ttl_hours,
+        "only_new_notes": args.only_new_notes
+    }
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    
+    config = dict(DEFAULT_CONFIG, **config)
+    logger.json_format = config["log_json"]
+    logger.set_log_file(config["log_file"])
+    error = validate_config(config)
+    if error:
+        logger.error(error)
+        logger.close()
+        return EXIT_CONFIG_ERROR
+    
+    # Ctrl+C / kill 时不再提交新任务，在途的笔记完成并写入断点日志后退出
+    stop = threading.Event()
+    def handle_signal(signum, frame):
+        logger.warning("收到停止信号，等待在途任务结束...")
+        stop.set()
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    
+    job = SimpleExtractionJob(
+        config,
+        logger=logger,
+        is_running=lambda: not stop.is_set(),
+        on_progress=lambda done, total: emit("progress", done=done, total=total),
+        on_note=lambda note: emit("note", note_id=note.note_id, title=note.title)
+    )
+    emit("start", mode=config["extract_mode"])
+    ok = job.run()
+    
+    if stop.is_set():
+        exit_code = EXIT_INTERRUPTED
+    elif not ok or (not job.note_count and not job.notes and job.failed_count):
+        exit_code = EXIT_FAILED
+    elif job.failed_count or job.upload_ok is False or not job.listing_ok:
+        exit_code = EXIT_PARTIAL
+    else:
+        exit_code = EXIT_OK
+    
+    emit("finished", notes=job.note_count, users=len(job.users), failed=job.failed_count,
+         upload=job.upload_ok, app_token=job.config["app_token"], table_id=job.config["table_id"],
+         exit_code=exit_code)
+    logger.close()
+    return exit_code
+
+# 启动耗时测量
+def report_startup_time(root, timings):
+    """窗口绘制完成后输出各阶段耗时（毫秒）并退出"""
+    root.update()
+    now = time.perf_counter()
+    result = {key: round((value - STARTUP_T0) * 1000, 1) for key, value in timings.items()}
+    result["window_shown"] = round((now - STARTUP_T0) * 1000, 1)
+    # 网络库不应该在窗口显示前加载
+    result["network_modules_loaded"] = [name for name in NETWORK_MODULES if name in sys.modules]
+    print(json.dumps(result), flush=True)
+    root.destroy()
+
+def main(measure_startup=False):
+    timings = {"module_loaded": time.perf_counter()}
+    load_tkinter()
+    timings["tkinter_loaded"] = time.perf_counter()
     root = tk.Tk()
     app = SimpleXiaohongshuFeishuGUI(root)
+    timings["widgets_created"] = time.perf_counter()
+    
+    if measure_startup:
+        root.after_idle(report_startup_time, root, timings)
+    else:
+        # 窗口显示后再在后台加载网络库
+        root.after(500, lambda: threading.Thread(target=preload_network_stack, daemon=True).start())
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    # --startup-time 测量图形界面启动耗时，其他参数使用命令行模式
+    if sys.argv[1:] == ["--startup-time"]:
+        main(measure_startup=True)
+    elif len(sys.argv) > 1:
+        sys.exit(cli_main(sys.argv[1:]))
+    else:
+        main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# simple_gui.py 是单文件脚本，测试时从上级目录导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
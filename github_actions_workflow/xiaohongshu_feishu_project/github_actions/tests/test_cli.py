@@ -0,0 +1,154 @@
+import pytest
+
+import simple_gui
+
+
+class FakeExtractor:
+    # 每个测试设置搜索结果、列表停止原因和提取失败的笔记
+    search_ids = []
+    search_stopped = "exhausted"
+    bad_ids = set()
+
+    def __init__(self, **kwargs):
+        pass
+
+    def extract_note_id(self, url):
+        return url
+
+    def iter_search_notes(self, keyword, sort_type=0, limit=None, state=None):
+        state["stopped"] = None
+        for count, note_id in enumerate(self.search_ids, 1):
+            yield note_id
+            if limit and count >= limit:
+                state["stopped"] = "limit"
+                return
+        state["stopped"] = self.search_stopped
+
+    def iter_user_note_ids(self, user_id, limit=None, since=None, state=None):
+        return self.iter_search_notes(user_id, limit=limit, state=state)
+
+    def extract_note(self, note_id):
+        if note_id in self.bad_ids:
+            return None
+        note = simple_gui.Note()
+        note.note_id = note_id
+        note.title = f"title {note_id}"
+        note.user_id = "u1"
+        return note
+
+    def extract_user(self, user_id):
+        user = simple_gui.User()
+        user.user_id = user_id
+        return user
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("XHS_COOKIE", "cookie")
+    monkeypatch.setattr(simple_gui, "SimpleXHSExtractor", FakeExtractor)
+    monkeypatch.setattr(FakeExtractor, "search_ids", ["a", "b", "c"])
+    monkeypatch.setattr(FakeExtractor, "search_stopped", "exhausted")
+    monkeypatch.setattr(FakeExtractor, "bad_ids", set())
+
+    def run(*args):
+        return simple_gui.cli_main(["--keyword", "test", "--output-format", "jsonl", *args])
+    return run
+
+
+def test_missing_cookie_is_config_error(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("XHS_COOKIE", raising=False)
+    assert simple_gui.cli_main(["--url", "https://www.xiaohongshu.com/explore/abc"]) == simple_gui.EXIT_CONFIG_ERROR
+
+
+def test_all_notes_extracted(cli):
+    assert cli() == simple_gui.EXIT_OK
+
+
+def test_some_notes_failed_is_partial(cli):
+    FakeExtractor.bad_ids = {"b"}
+    assert cli() == simple_gui.EXIT_PARTIAL
+
+
+def test_all_notes_failed(cli):
+    FakeExtractor.bad_ids = {"a", "b", "c"}
+    assert cli() == simple_gui.EXIT_FAILED
+
+
+def test_rejected_search_fails(cli):
+    FakeExtractor.search_ids = []
+    FakeExtractor.search_stopped = "error"
+    assert cli() == simple_gui.EXIT_FAILED
+
+
+def test_no_search_results_fails(cli):
+    FakeExtractor.search_ids = []
+    assert cli() == simple_gui.EXIT_FAILED
+
+
+def test_search_rejected_midway_is_partial(cli):
+    FakeExtractor.search_stopped = "error"
+    assert cli() == simple_gui.EXIT_PARTIAL
+
+
+def test_rejected_user_listing_fails(cli):
+    FakeExtractor.search_ids = []
+    FakeExtractor.search_stopped = "error"
+    assert simple_gui.cli_main(["--user-id", "u1", "--output-format", "jsonl"]) == simple_gui.EXIT_FAILED
+
+
+def test_user_notes_extracted(cli):
+    assert simple_gui.cli_main(["--user-id", "u1", "--output-format", "jsonl"]) == simple_gui.EXIT_OK
+
+
+class FakeBitable(simple_gui.SimpleFeishuBitable):
+    # 记录建表和写入的调用，不发送请求
+    calls = []
+
+    def __init__(self, auth, logger=None, schema_cache=None):
+        self.logger = logger
+        self.schema_cache = schema_cache
+        self.upload_cache = None
+        self.failed_records = []
+        self.written_records = []
+
+    def create_app(self, name):
+        self.calls.append("create_app")
+        return "app"
+
+    def setup_xiaohongshu_table(self, app_token):
+        self.calls.append("create_table")
+        return {"table_id": "tbl", "field_map": {"笔记ID": "fld1", "标题": "fld2"}}
+
+    def batch_write_records(self, app_token, table_id, action, payloads, action_name):
+        self.calls.append(action)
+        record_ids = [f"r{i}" for i in range(len(payloads))]
+        self.written_records.extend(zip(payloads, record_ids))
+        return record_ids
+
+
+@pytest.fixture
+def upload_cli(cli, tmp_path, monkeypatch):
+    monkeypatch.setenv("FEISHU_APP_ID", "app-id")
+    monkeypatch.setenv("FEISHU_APP_SECRET", "app-secret")
+    monkeypatch.setattr(simple_gui, "get_feishu_auth", lambda app_id, app_secret, logger=None: object())
+    monkeypatch.setattr(simple_gui, "SimpleFeishuBitable", FakeBitable)
+    monkeypatch.setattr(FakeBitable, "calls", [])
+    config_file = tmp_path / "upload.json"
+    config_file.write_text('{"create_table": true, "download_images": false}', encoding="utf-8")
+    return lambda: cli("--upload", "--no-db", "--config", str(config_file))
+
+
+def test_upload_provisions_table_on_first_note(upload_cli):
+    assert upload_cli() == simple_gui.EXIT_OK
+    assert FakeBitable.calls == ["create_app", "create_table", "batch_create"]
+
+
+def test_upload_without_notes_creates_nothing(upload_cli):
+    FakeExtractor.search_ids = []
+    assert upload_cli() == simple_gui.EXIT_FAILED
+    assert FakeBitable.calls == []
@@ -0,0 +1,103 @@
+import simple_gui
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.reason = "OK"
+        self.headers = {}
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return self.responses.pop(0)
+
+
+class FakeAuth:
+    app_id = "test-app"
+
+    def get_tenant_access_token(self):
+        return "token"
+
+    def invalidate(self, token=None):
+        pass
+
+
+class FakeLimiter:
+    def acquire(self):
+        pass
+
+
+def make_bitable(tmp_path, responses):
+    session = FakeSession(responses)
+    bitable = simple_gui.SimpleFeishuBitable(
+        FakeAuth(),
+        session=session,
+        rate_limiter=FakeLimiter(),
+        circuit_breaker=simple_gui.SimpleCircuitBreaker(),
+        schema_cache=simple_gui.SimpleSchemaCache(path=str(tmp_path / "schema.json")),
+    )
+    bitable.upload_cache = simple_gui.SimpleUploadCache(path=str(tmp_path / "upload.json"))
+    bitable.upload_cache.put("app", "hash1", "tok1")
+    bitable.schema_cache.put("app", "tbl", {"标题": "fld1"})
+    return bitable, session
+
+
+RECORD = {"标题": "a", "图片": [{"file_token": "tok1"}]}
+
+
+def test_batch_create_success_uses_client_token(tmp_path):
+    bitable, session = make_bitable(tmp_path, [FakeResponse({"code": 0, "data": {"records": [{"record_id": "r1"}]}})])
+    assert bitable.batch_create_records("app", "tbl", [RECORD]) == ["r1"]
+    assert session.calls[0][2]["params"]["client_token"]
+    assert bitable.written_records == [({"fields": RECORD}, "r1")]
+
+
+def test_batch_update_has_no_client_token(tmp_path):
+    bitable, session = make_bitable(tmp_path, [FakeResponse({"code": 0, "data": {"records": [{"record_id": "r1"}]}})])
+    bitable.batch_update_records("app", "tbl", [{"record_id": "r1", "fields": {"标题": "b"}}])
+    assert session.calls[0][2]["params"] is None
+
+
+def test_client_token_reused_on_retry(tmp_path, monkeypatch):
+    monkeypatch.setattr(simple_gui.time, "sleep", lambda seconds: None)
+    bitable, session = make_bitable(tmp_path, [
+        FakeResponse({"code": 1254291, "msg": "conflict"}),
+        FakeResponse({"code": 0, "data": {"records": [{"record_id": "r1"}]}}),
+    ])
+    assert bitable.batch_create_records("app", "tbl", [RECORD]) == ["r1"]
+    tokens = [call[2]["params"]["client_token"] for call in session.calls]
+    assert len(tokens) == 2 and tokens[0] == tokens[1]
+
+
+def test_attachment_error_invalidates_upload_cache(tmp_path):
+    bitable, _ = make_bitable(tmp_path, [FakeResponse({"code": 1254069, "msg": "AttachFieldConvFail"}, status_code=400)])
+    assert bitable.batch_create_records("app", "tbl", [RECORD]) == []
+    assert bitable.failed_records == [{"fields": RECORD}]
+    assert bitable.upload_cache.get("app", "hash1") is None
+    assert bitable.schema_cache.get("app", "tbl") == {"标题": "fld1"}
+
+
+def test_field_error_invalidates_schema_only(tmp_path):
+    bitable, _ = make_bitable(tmp_path, [FakeResponse({"code": 1254045, "msg": "FieldNameNotFound"}, status_code=400)])
+    assert bitable.batch_create_records("app", "tbl", [RECORD]) == []
+    assert bitable.schema_cache.get("app", "tbl") is None
+    assert bitable.upload_cache.get("app", "hash1") == "tok1"
+
+
+def test_rate_limit_exhaustion_keeps_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(simple_gui.time, "sleep", lambda seconds: None)
+    bitable, _ = make_bitable(tmp_path, [FakeResponse({"code": 99991400, "msg": "limited"}) for _ in range(5)])
+    bitable.circuit_breaker.wait = lambda: None
+    assert bitable.batch_create_records("app", "tbl", [RECORD]) == []
+    assert bitable.upload_cache.get("app", "hash1") == "tok1"
+    assert bitable.schema_cache.get("app", "tbl") == {"标题": "fld1"}
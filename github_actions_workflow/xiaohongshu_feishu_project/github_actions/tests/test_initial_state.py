@@ -0,0 +1,25 @@
+import simple_gui
+
+
+def page(state):
+    return ("<html><script>window.__INITIAL_STATE__=" + state + ";var x=1;</script></html>").encode("utf-8")
+
+
+def test_extract_initial_state_reads_object():
+    data = simple_gui.extract_initial_state(page('{"note":{"id":"abc","desc":"a;b"}}'))
+    assert data == {"note": {"id": "abc", "desc": "a;b"}}
+
+
+def test_extract_initial_state_missing_marker():
+    assert simple_gui.extract_initial_state(b"<html></html>") is None
+
+
+def test_extract_initial_state_replaces_bare_undefined():
+    data = simple_gui.extract_initial_state(page('{"a":undefined,"b":[undefined,1,undefined]}'))
+    assert data == {"a": None, "b": [None, 1, None]}
+
+
+def test_extract_initial_state_keeps_undefined_inside_strings():
+    state = '{"desc":"value is undefined, really","title":"\\"undefined\\"","path":"C:\\\\","c":undefined}'
+    data = simple_gui.extract_initial_state(page(state))
+    assert data == {"desc": "value is undefined, really", "title": '"undefined"', "path": "C:\\", "c": None}
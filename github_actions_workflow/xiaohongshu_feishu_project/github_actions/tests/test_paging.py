@@ -0,0 +1,171 @@
+import json
+
+import pytest
+
+import simple_gui
+
+USER_ID = "5a0000000000000000000001"
+
+
+def note_id(published_at, n):
+    """与小红书笔记ID格式相同：前8位是发布时间戳"""
+    return f"{published_at:08x}{n:016x}"
+
+
+def profile_item(nid, user_id=USER_ID, sticky=False):
+    return {"id": nid, "noteCard": {"noteId": nid, "user": {"userId": user_id}, "interactInfo": {"sticky": sticky}}}
+
+
+class FakeResponse:
+    def __init__(self, payload=None, content=b"", status_code=200):
+        self.payload = payload
+        self.content = content
+        self.status_code = status_code
+        self.reason = "OK"
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def extractor(tmp_path):
+    extractor = simple_gui.SimpleXHSExtractor("cookie", output_dir=str(tmp_path / "images"))
+    yield extractor
+    extractor.close()
+
+
+def search_page(ids):
+    state = {"search": {"items": [{"id": nid} for nid in ids]}}
+    return FakeResponse(content=f"<script>window.__INITIAL_STATE__={json.dumps(state)}</script>".encode("utf-8"))
+
+
+def test_search_pages_until_limit(extractor, monkeypatch):
+    pages = {1: ["a", "b"], 2: ["b", "c", "d"]}
+    requested = []
+
+    def request(endpoint, url):
+        page = int(url.rsplit("page=", 1)[1])
+        requested.append(page)
+        return search_page(pages.get(page, []))
+    monkeypatch.setattr(extractor, "request", request)
+
+    state = {}
+    assert list(extractor.iter_search_notes("k", limit=3, state=state)) == ["a", "b", "c"]
+    assert state["stopped"] == "limit"
+    assert requested == [1, 2]
+
+
+def test_search_stops_when_exhausted(extractor, monkeypatch):
+    monkeypatch.setattr(extractor, "request", lambda endpoint, url: search_page(["a"] if url.endswith("page=1") else []))
+    state = {}
+    assert list(extractor.iter_search_notes("k", limit=10, state=state)) == ["a"]
+    assert state["stopped"] == "exhausted"
+
+
+def test_search_rejected(extractor, monkeypatch):
+    monkeypatch.setattr(extractor, "request", lambda endpoint, url: FakeResponse(status_code=461))
+    state = {}
+    assert list(extractor.iter_search_notes("k", state=state)) == []
+    assert state["stopped"] == "error"
+
+
+def test_user_notes_flatten_profile_tabs(extractor, monkeypatch):
+    first, second, liked = note_id(1700000300, 1), note_id(1700000200, 2), note_id(1700000100, 3)
+    profile = {"notes": [[profile_item(first), None, profile_item(second)], [profile_item(liked, user_id="other")], []]}
+    monkeypatch.setattr(extractor, "fetch_user_profile", lambda user_id: profile)
+    monkeypatch.setattr(extractor, "request", lambda endpoint, url: FakeResponse({"code": 0, "data": {"notes": [], "has_more": False}}))
+
+    state = {}
+    assert list(extractor.iter_user_note_ids(USER_ID, limit=None, state=state)) == [first, second]
+    assert state["stopped"] == "exhausted"
+
+
+def test_user_notes_page_with_cursor(extractor, monkeypatch):
+    first, second = note_id(1700000300, 1), note_id(1700000200, 2)
+    monkeypatch.setattr(extractor, "fetch_user_profile", lambda user_id: {"notes": [[profile_item(first)]]})
+    cursors = []
+
+    def request(endpoint, url):
+        cursors.append(url.split("cursor=", 1)[1].split("&", 1)[0])
+        return FakeResponse({"code": 0, "data": {"notes": [{"note_id": second}, "junk"], "has_more": False}})
+    monkeypatch.setattr(extractor, "request", request)
+
+    assert list(extractor.iter_user_note_ids(USER_ID, limit=None)) == [first, second]
+    assert cursors == [first]
+
+
+def test_user_notes_unsigned_paging_rejected(extractor, monkeypatch):
+    first = note_id(1700000300, 1)
+    monkeypatch.setattr(extractor, "fetch_user_profile", lambda user_id: {"notes": [[profile_item(first)]]})
+    monkeypatch.setattr(extractor, "request", lambda endpoint, url: FakeResponse({"code": -1, "success": False, "data": {}}))
+
+    state = {}
+    assert list(extractor.iter_user_note_ids(USER_ID, limit=None, state=state)) == [first]
+    assert state["stopped"] == "error"
+
+
+def test_user_notes_stop_at_watermark_skipping_sticky(extractor, monkeypatch):
+    newest, sticky, seen_before = note_id(1700000300, 1), note_id(1600000000, 2), note_id(1700000100, 3)
+    profile = {"notes": [[profile_item(sticky, sticky=True), profile_item(newest), profile_item(seen_before)]]}
+    monkeypatch.setattr(extractor, "fetch_user_profile", lambda user_id: profile)
+
+    state = {}
+    assert list(extractor.iter_user_note_ids(USER_ID, limit=None, since=1700000100, state=state)) == [newest]
+    assert state["stopped"] == "since"
+
+
+class FakeUserExtractor(simple_gui.SimpleXHSExtractor):
+    # 主页数据固定，翻页接口返回 page_result
+    profile_ids = []
+    page_result = {"code": 0, "data": {"notes": [], "has_more": False}}
+
+    def fetch_user_profile(self, user_id):
+        return {"notes": [[profile_item(nid) for nid in self.profile_ids]], "userPageData": {}}
+
+    def request(self, endpoint, url, **kwargs):
+        return FakeResponse(self.page_result)
+
+    def extract_user(self, user_id):
+        user = simple_gui.User()
+        user.user_id = user_id
+        return user
+
+    def extract_note(self, nid):
+        note = simple_gui.Note()
+        note.note_id = nid
+        note.user_id = USER_ID
+        return note
+
+
+@pytest.fixture
+def user_cli(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("XHS_COOKIE", "cookie")
+    monkeypatch.setattr(simple_gui, "SimpleXHSExtractor", FakeUserExtractor)
+
+    def run(ids, page_result=None):
+        monkeypatch.setattr(FakeUserExtractor, "profile_ids", ids)
+        if page_result is not None:
+            monkeypatch.setattr(FakeUserExtractor, "page_result", page_result)
+        code = simple_gui.cli_main(["--user-id", USER_ID, "--only-new", "--no-db", "--output-format", "jsonl", "--count", "0"])
+        watermarks = simple_gui.SimpleWatermarkCache()
+        watermarks.load()
+        return code, watermarks.get(USER_ID)
+    return run
+
+
+def test_watermark_advances_after_full_listing(user_cli):
+    old, new = note_id(1700000100, 1), note_id(1700000300, 2)
+    assert user_cli([old]) == (simple_gui.EXIT_OK, 1700000100)
+    # 第二次只有更新的笔记，水位前进
+    assert user_cli([new, old]) == (simple_gui.EXIT_OK, 1700000300)
+    # 没有新笔记也是正常结果
+    assert user_cli([new, old]) == (simple_gui.EXIT_OK, 1700000300)
+
+
+def test_watermark_kept_when_paging_rejected(user_cli):
+    old, new = note_id(1700000100, 1), note_id(1700000300, 2)
+    assert user_cli([old]) == (simple_gui.EXIT_OK, 1700000100)
+    # 第一屏都是新笔记，翻页被拒绝，无法确认已翻到上次的位置
+    rejected = {"code": -1, "success": False, "data": {}}
+    assert user_cli([new], page_result=rejected) == (simple_gui.EXIT_PARTIAL, 1700000100)